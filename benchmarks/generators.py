@@ -0,0 +1,121 @@
+"""Seeded generators for synthetic employee directories and coordination exports"""
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Лебедев', 'Козлов', 'Новиков',
+            'Морозов', 'Волков', 'Соловьёв', 'Васильев', 'Зайцев', 'Павлов', 'Семёнов', 'Голубев', 'Виноградов',
+            'Богданов', 'Воробьёв', 'Фёдоров', 'Михайлов', 'Беляев', 'Тарасов', 'Белов', 'Комаров', 'Орлов',
+            'Киселёв', 'Макаров', 'Андреев', 'Ковалёв', 'Ильин', 'Гусев', 'Титов', 'Кузьмин', 'Кудрявцев']
+GIVEN_NAMES = ['Иван', 'Пётр', 'Сергей', 'Алексей', 'Дмитрий', 'Андрей', 'Михаил', 'Николай', 'Владимир',
+               'Анна', 'Мария', 'Елена', 'Ольга', 'Юлия', 'Татьяна', 'Наталья', 'Ирина', 'Екатерина']
+PATRONYMICS = ['Иванович', 'Петрович', 'Сергеевич', 'Алексеевич', 'Андреевна', 'Михайловна', 'Николаевна']
+LATIN_SURNAMES = ['Smith', 'Johnson', 'Brown', 'Miller', 'Wilson', 'Garcia', 'Müller', 'Schmidt']
+LATIN_GIVEN_NAMES = ['John', 'Anna', 'Michael', 'Sarah', 'David', 'Laura']
+CORPORATE_DOMAINS = ['stroyproekt.ru', 'giprogor.ru', 'mostinzh.com', 'energoset.ru', 'arhbureau.ru',
+                     'techexpert.com', 'gorplan.ru', 'konstrukt.ru']
+PUBLIC_DOMAINS = ['mail.ru', 'yandex.ru', 'gmail.com']
+SECTIONS = ['АР', 'КР', 'ОВ', 'ВК', 'ЭОМ', 'СС', 'ПОС', 'ГП']
+WORKFLOWS = ['Согласование раздела КР', 'Согласование раздела АР', 'Проверка документации',
+             'Согласование изменений', 'Рабочая документация']
+TRANSLIT = dict(zip('абвгдеёжзийклмнопрстуфхцчшщъыьэюя',
+                    ['a', 'b', 'v', 'g', 'd', 'e', 'e', 'zh', 'z', 'i', 'y', 'k', 'l', 'm', 'n', 'o', 'p', 'r',
+                     's', 't', 'u', 'f', 'kh', 'ts', 'ch', 'sh', 'shch', '', 'y', '', 'e', 'yu', 'ya']))
+
+
+def transliterate(text):
+    """Latin spelling of a Cyrillic name for email addresses"""
+    return ''.join(TRANSLIT.get(c, c) for c in text.lower())
+
+
+def generate_employees(count, seed=0):
+    """Employees as dicts with name, email and team number, in teams of one to four"""
+    rng = random.Random(seed)
+    employees = []
+    team = 0
+    while len(employees) < count:
+        team += 1
+        domain = rng.choice(CORPORATE_DOMAINS)
+        for _ in range(min(rng.randint(1, 4), count - len(employees))):
+            if rng.random() < 0.1:
+                surname, given, patronymic = rng.choice(LATIN_SURNAMES), rng.choice(LATIN_GIVEN_NAMES), ''
+            else:
+                surname, given, patronymic = rng.choice(SURNAMES), rng.choice(GIVEN_NAMES), rng.choice(PATRONYMICS)
+            style = rng.randrange(4)
+            if style == 0:
+                name = f"{surname} {given[0]}.{patronymic[:1] + '.' if patronymic else ''}"
+            elif style == 1:
+                name = f"{given} {surname}"
+            elif style == 2:
+                name = f"{surname} {given} {patronymic}".strip()
+            else:
+                name = f"{given[0]}. {surname}"
+            email_domain = rng.choice(PUBLIC_DOMAINS) if rng.random() < 0.05 else domain
+            email = f"{transliterate(surname)}.{transliterate(given)[:1]}{len(employees)}@{email_domain}"
+            employees.append({'name': name, 'email': email, 'surname': surname, 'given': given,
+                              'patronymic': patronymic, 'team': team})
+    return employees
+
+
+def generate_contacts(employees, seed=0):
+    """Contact sheet with one cell per team, members joined with ' / '"""
+    rng = random.Random(seed)
+    teams = {}
+    for employee in employees:
+        teams.setdefault(employee['team'], []).append(employee)
+
+    rows = []
+    for team, members in teams.items():
+        block = ' / '.join(f"{member['name']} {member['email']}" for member in members)
+        rows.append({'Раздел': f"Раздел {rng.choice(SECTIONS)}-{team}",
+                     'Ответственные': f"Проектировщик ({block})",
+                     'Примечание': rng.choice(['', 'Основной подрядчик', 'Субподрядчик'])})
+    return pd.DataFrame(rows)
+
+
+def approver_spelling(employee, rng):
+    """How an employee's name appears in the approver columns of an export"""
+    style = rng.randrange(5)
+    if style == 0:
+        return f"{employee['surname']} {employee['given']} {employee['patronymic']}".strip()
+    if style == 1:
+        initials = employee['given'][0] + '.' + (employee['patronymic'][:1] + '.' if employee['patronymic'] else '')
+        return f"{employee['surname']} {initials}"
+    if style == 2:
+        return f"{employee['given']} {employee['surname']}"
+    if style == 3:
+        return f"{employee['surname']} {employee['given']}".upper()
+    return f"{employee['surname']} {employee['given'][0]}."
+
+
+def generate_coordinations(rows, employees, seed=0, start=datetime(2024, 9, 2), days=120):
+    """Coordination export with the columns process_coordinations reads"""
+    rng = random.Random(seed)
+    records = []
+    for coord_id in range(1, rows + 1):
+        created = start + timedelta(days=rng.randrange(days), hours=rng.randrange(8, 19), minutes=rng.randrange(60))
+        step = rng.choice(['Шаг 1', 'Шаг 2', 'Шаг 3', 'Утверждение'])
+
+        lifecycle = []
+        moment = created
+        for step_number in range(rng.randrange(1, 5)):
+            moment += timedelta(days=rng.randrange(0, 4), hours=rng.randrange(0, 9))
+            lifecycle.append(f"Шаг {step_number}: отправлено на согласование {moment.strftime('%d.%m.%y %H:%M')}")
+
+        def approvers(count):
+            names = [approver_spelling(rng.choice(employees), rng) for _ in range(count)]
+            if names and rng.random() < 0.05:
+                names[0] = 'Неизвестный Н.Н.'
+            return ', '.join(names)
+
+        records.append({
+            'ID': coord_id,
+            'Шаг': step,
+            'Рабочий процесс': rng.choice(WORKFLOWS),
+            'Жизненный цикл': '\n'.join(lifecycle) if rng.random() < 0.8 else '',
+            'Дата и время создания согласования': created.strftime('%Y-%m-%d %H:%M:%S'),
+            'Не проверили на текущем шаге': approvers(rng.randrange(0, 4)),
+            'Проверили на текущем шаге': approvers(rng.randrange(0, 3)),
+        })
+    return pd.DataFrame(records)
@@ -0,0 +1,135 @@
+"""Time the processing stages on synthetic data and save the results as JSON
+
+    python -m benchmarks.run_benchmarks --sizes 1000 100000
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/<earlier run>.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.generators import generate_employees, generate_contacts, generate_coordinations
+from coordinations_core import (
+    iter_contact_cells, iter_combined_lines, extract_employees, build_company_person_map,
+    index_company_people, iter_coordination_chunks, coordination_deadlines, process_coordinations,
+    write_coordination_details
+)
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+REFERENCE_DATE = date(2025, 1, 20)
+
+
+@contextmanager
+def timed(stages, name):
+    """Record the wall time of the block under stages[name]"""
+    started = time.perf_counter()
+    yield
+    stages[name] = round(time.perf_counter() - started, 4)
+
+
+def git_commit():
+    """Current commit of the working tree, if available"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(rows, employee_count, seed, workdir):
+    """Generate data for one export size and time each stage on it
+
+    parse: contact sheet to employees and match index; load: reading the export;
+    deadline: working days and deadlines for all rows; match: the full
+    process_coordinations run; export: writing coordination_details.xlsx.
+    """
+    employees = generate_employees(employee_count, seed)
+    contacts_path = Path(workdir) / f'contacts_{rows}.csv'
+    export_path = Path(workdir) / f'export_{rows}.csv'
+    generate_contacts(employees, seed).to_csv(contacts_path, sep=';', index=False)
+    generate_coordinations(rows, employees, seed).to_csv(export_path, sep=';', index=False)
+
+    stages = {}
+    with timed(stages, 'parse'):
+        with open(contacts_path, 'rb') as f:
+            teams = {}
+            parsed, _, _ = extract_employees(iter_combined_lines(iter_contact_cells(f)), set(), teams=teams)
+        company_person_map = build_company_person_map(parsed)
+        match_index = index_company_people(company_person_map, teams)
+
+    with timed(stages, 'load'):
+        with open(export_path, 'rb') as f:
+            df = pd.concat([chunk for chunk, _ in iter_coordination_chunks(f)], ignore_index=True)
+
+    with timed(stages, 'deadline'):
+        coordination_deadlines(df)
+
+    with timed(stages, 'match'):
+        _, _, overdue_ids, details = process_coordinations(df, company_person_map, REFERENCE_DATE,
+                                                           batch_matching=True, match_index=match_index)
+
+    with timed(stages, 'export'):
+        write_coordination_details(details, Path(workdir) / f'details_{rows}.xlsx')
+
+    return {'rows': rows, 'employees': len(parsed), 'overdue': len(overdue_ids), 'stages': stages}
+
+
+def compare(current, previous):
+    """Print stage timings of this run next to an earlier one"""
+    previous_by_rows = {result['rows']: result for result in previous['results']}
+    for result in current['results']:
+        before = previous_by_rows.get(result['rows'])
+        if not before:
+            continue
+        for stage, seconds in result['stages'].items():
+            old_seconds = before['stages'].get(stage)
+            if old_seconds:
+                print(f"{result['rows']:>9} {stage:<9} {old_seconds:>9.3f}s -> {seconds:>9.3f}s "
+                      f"({old_seconds / max(seconds, 1e-9):.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark coordination processing on synthetic data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help="coordination export sizes in rows")
+    parser.add_argument('--employees', type=int, default=3000, help="employees in the synthetic directory")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': []
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.sizes:
+            result = run_size(rows, args.employees, args.seed, workdir)
+            run['results'].append(result)
+            print(f"{rows:>9} rows: " + ', '.join(f"{stage} {seconds:.3f}s"
+                                                  for stage, seconds in result['stages'].items()))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{run['timestamp'].replace(':', '-')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(run, f, ensure_ascii=False, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(run, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
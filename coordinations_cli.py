@@ -0,0 +1,153 @@
+"""Headless batch processing of coordination exports
+
+Runs the same matching as the Data Matching mode without Streamlit, e.g.
+for a nightly job:
+
+    python coordinations_cli.py exports/ --date 2024-11-29 --output-dir results/
+"""
+import argparse
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from coordinations_core import (
+    EMPLOYEE_DB_BACKEND, EXPORT_FORMATS, read_employee_db, write_employee_db, extract_employees_bulk,
+    build_company_person_map, new_match_cache, iter_coordination_chunks,
+    process_coordinations_chunked, write_coordination_details, overdue_emails_text,
+    make_process_pool, shared_match_state, record_run_history, new_unmatched_names, unmatched_names_csv
+)
+
+EXPORT_EXTENSIONS = ('.csv', '.xlsx')
+
+
+def load_employees(employee_files, backend):
+    """Load the employee database, adding employees parsed from contact files in one import"""
+    db = read_employee_db(backend)
+    seen_emails = {e['email'] for e in db['employees']}
+
+    contact_files = [(str(path), Path(path).read_bytes()) for path in employee_files]
+    new_employees, manual_assignments, companies = extract_employees_bulk(contact_files, seen_emails,
+                                                                          teams=db['teams'])
+    db['companies'].update(companies)
+    for email, data in manual_assignments.items():
+        print(f"Skipping {email} from {data['file']}: public domain, assign its company in Data Loading mode",
+              file=sys.stderr)
+
+    if new_employees:
+        db['employees'].extend(new_employees)
+        write_employee_db(db, new_employees, backend)
+        print(f"Added {len(new_employees)} new employees to database")
+
+    return db
+
+
+def process_export_file(path, selected_date, output_dir, batch_matching, export_format='xlsx', record_history=True):
+    """Process one coordination export in a pool worker and write its result files
+
+    Files run on all cores at once, so each scores its fuzzy fallbacks on one
+    thread. Approvers not found in the database are written to
+    unmatched_names.csv.
+    With record_history the results are also appended to the history store.
+    """
+    company_person_map, match_index = shared_match_state()
+    unmatched_names = new_unmatched_names()
+
+    with open(path, 'rb') as f:
+        overdue_counts, overdue_emails, overdue_coordination_ids, coordination_details = \
+            process_coordinations_chunked(
+                iter_coordination_chunks(f), company_person_map, selected_date,
+                batch_matching=batch_matching, match_cache=new_match_cache(match_index['db_hash']),
+                match_index=match_index, unmatched_names=unmatched_names, fuzzy_workers=1
+            )
+
+    file_output_dir = Path(output_dir) / Path(path).stem
+    file_output_dir.mkdir(parents=True, exist_ok=True)
+    details_file_name, _ = EXPORT_FORMATS[export_format]
+    write_coordination_details(coordination_details, file_output_dir / details_file_name, export_format)
+    with open(file_output_dir / 'overdue_emails.txt', 'w', encoding='utf-8') as f:
+        f.write(overdue_emails_text(overdue_emails))
+    with open(file_output_dir / 'unmatched_names.csv', 'w', encoding='utf-8-sig', newline='') as f:
+        f.write(unmatched_names_csv(unmatched_names))
+    if record_history:
+        record_run_history(overdue_counts, overdue_emails, coordination_details, selected_date, Path(path).name)
+
+    return {
+        'file': Path(path).name,
+        'overdue_counts': dict(overdue_counts),
+        'total_overdue': len(overdue_coordination_ids),
+        'unique_emails': len(set(overdue_emails)),
+        'unmatched_names': len(unmatched_names['counts'])
+    }
+
+
+def write_summary(file_summaries, output_path):
+    """Write overdue counts merged over all files, and per file, to an Excel workbook"""
+    company_totals = defaultdict(int)
+    for summary in file_summaries:
+        for company, count in summary['overdue_counts'].items():
+            company_totals[company] += count
+
+    by_company = pd.DataFrame(sorted(company_totals.items(), key=lambda x: x[1], reverse=True),
+                              columns=['company', 'overdue'])
+    by_file = pd.DataFrame([{'file': summary['file'], 'total_overdue': summary['total_overdue'],
+                             'unique_emails': summary['unique_emails']}
+                            for summary in file_summaries])
+    with pd.ExcelWriter(output_path, engine='xlsxwriter') as writer:
+        by_company.to_excel(writer, index=False, sheet_name='By Company')
+        by_file.to_excel(writer, index=False, sheet_name='By File')
+
+    return company_totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process coordination exports without the Streamlit UI")
+    parser.add_argument('exports_dir', help="directory with coordination exports (CSV or Excel)")
+    parser.add_argument('--date', required=True, type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        help="reference date for overdue calculation, YYYY-MM-DD")
+    parser.add_argument('--output-dir', default='results', help="where to write the per-file results")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--employees', nargs='*', default=[],
+                        help="company and employee data files to add to the database first")
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default=EMPLOYEE_DB_BACKEND,
+                        help="employee database backend")
+    parser.add_argument('--no-batch-matching', action='store_true',
+                        help="score fuzzy fallbacks one name at a time")
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='xlsx',
+                        help="coordination details file format (parquet needs pyarrow)")
+    parser.add_argument('--no-history', action='store_true',
+                        help="do not add the results to the history store")
+    args = parser.parse_args(argv)
+
+    export_files = sorted(path for path in Path(args.exports_dir).iterdir()
+                          if path.suffix.lower() in EXPORT_EXTENSIONS)
+    if not export_files:
+        parser.error(f"no CSV or Excel exports found in {args.exports_dir}")
+
+    db = load_employees(args.employees, args.backend)
+    if not db['employees']:
+        parser.error("no employee data found, load employees first")
+
+    company_person_map = build_company_person_map(db['employees'])
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+
+    with make_process_pool(company_person_map, args.workers, teams=db['teams']) as pool:
+        futures = [pool.submit(process_export_file, str(path), args.date, args.output_dir,
+                               not args.no_batch_matching, args.format, not args.no_history)
+                   for path in export_files]
+        file_summaries = [future.result() for future in futures]
+
+    company_totals = write_summary(file_summaries, Path(args.output_dir) / 'summary.xlsx')
+
+    for summary in file_summaries:
+        print(f"{summary['file']}: {summary['total_overdue']} overdue, {summary['unique_emails']} emails, "
+              f"{summary['unmatched_names']} unmatched names")
+    for company, count in sorted(company_totals.items(), key=lambda x: x[1], reverse=True):
+        print(f"- {company}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2260 @@
+import re
+import json
+import pandas as pd
+from datetime import datetime, date, timedelta
+from collections import defaultdict, Counter
+from pathlib import Path
+import os
+import unicodedata
+import hashlib
+import time
+import csv
+import io
+import importlib.util
+import sqlite3
+import multiprocessing
+import threading
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from rapidfuzz import fuzz, process
+import numpy as np
+import openpyxl
+import xlsxwriter
+from functools import lru_cache, partial
+from contextlib import contextmanager, nullcontext
+
+# Configuration
+EMPLOYEE_DB_FILE = 'employee_database.json'
+EMPLOYEE_DB_SQLITE_FILE = str(Path(EMPLOYEE_DB_FILE).with_suffix('.sqlite3'))
+EMPLOYEE_DB_BACKEND = os.environ.get('EMPLOYEE_DB_BACKEND', 'json')  # 'json' or 'sqlite'
+MATCH_CACHE_FILE = str(Path(EMPLOYEE_DB_FILE).with_name('match_cache.json'))
+ROW_STATE_FILE = str(Path(EMPLOYEE_DB_FILE).with_name('row_state.json'))
+HISTORY_DB_FILE = str(Path(EMPLOYEE_DB_FILE).with_name('history.sqlite3'))
+STAGE_RULES_FILE = os.environ.get('STAGE_RULES_FILE', str(Path(__file__).with_name('stage_rules.json')))
+public_domains = {'mail', 'yandex', 'gmail', 'yahoo', 'hotmail', 'outlook'}
+holidays = ['01-01', '02-01', '03-01', '04-01', '05-01', '06-01', '07-01', '23-02', '08-03', '01-05', '09-05', '12-06',
+            '03-11', '04-11']
+working_holidays = ['01-11']
+MATCH_SCORE_THRESHOLD = 65
+REQUIRED_COLUMNS = ['Не проверили на текущем шаге', 'Шаг', 'Рабочий процесс']
+LIFECYCLE_CACHE_SIZE = 4096
+WORKING_DAYS_CACHE_SIZE = 4096
+STEP_NUMBER_PATTERN = re.compile(r'Шаг (\d+)')
+NORMALIZE_CACHE_SIZE = 65536
+COORDINATION_CHUNK_SIZE = 50000
+# Zero-width, so a timestamp starting inside a step's digits is found too
+LIFECYCLE_TOKEN_PATTERN = re.compile(r'(?=Шаг (\d+)|(\d{2}\.\d{2}\.\d{2} \d{2}:\d{2}))', re.IGNORECASE)
+CONTACT_CHUNK_SIZE = 10000
+PARALLEL_SHARD_SIZE = 5000
+# Fuzzy fallbacks scored per thread pool task in batch matching
+FUZZY_BATCH_SIZE = 64
+EXPORT_BATCH_SIZE = 50000
+# Background jobs run at once, only their saves of the shared match cache and row state files are serialized
+JOB_WORKERS = 4
+JOB_HISTORY_SIZE = 20
+UNMATCHED_NAMES_LIMIT = 10000
+EXPORT_FORMATS = {
+    'xlsx': ('coordination_details.xlsx', 'application/vnd.ms-excel'),
+    'csv': ('coordination_details.csv', 'text/csv'),
+    'parquet': ('coordination_details.parquet', 'application/octet-stream'),
+}
+ROW_STATE_VERSION = 2
+# 2: team lists stored once per team in db['teams'] instead of on every member
+# 3: normalized_surname and normalized_given_names stored on every employee
+EMPLOYEE_DB_SCHEMA_VERSION = 3
+# Columns a row's deadline and approver matches depend on, besides the id column
+FINGERPRINT_COLUMNS = ['Шаг', 'Рабочий процесс', 'Дата и время создания согласования', 'Жизненный цикл',
+                       'Не проверили на текущем шаге', 'Проверили на текущем шаге']
+CONTACT_BLOCK_PATTERN = re.compile(
+    r'(?:\(| - )([^()]+?\s+[^\s@]+@[^\s/@]+(?:\s*/\s*[^()]+?\s+[^\s@]+@[^\s/@]+)*)'
+)
+CONTACT_PERSON_PATTERN = re.compile(r'([^@]+)\s+([^\s@]+@[^\s@]+)')
+EMAIL_TRAILING_PATTERN = re.compile(r'[),.;]+$')
+
+
+def new_run_stats():
+    """Empty run statistics: per-stage timings and named counters"""
+    return {'stages': {}, 'counters': defaultdict(int)}
+
+
+@contextmanager
+def stage_timer(stats, name, rows_in=0):
+    """Add the wall time of the block to stats['stages'][name]
+
+    Yields a dict whose 'rows_in'/'rows_out' are added to the stage totals, so
+    repeated stages (one per chunk) accumulate. Does nothing if stats is None.
+    """
+    stage = {'rows_in': rows_in, 'rows_out': 0}
+    if stats is None:
+        yield stage
+        return
+
+    started = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        totals = stats['stages'].setdefault(name, {'seconds': 0.0, 'calls': 0, 'rows_in': 0, 'rows_out': 0})
+        totals['seconds'] += time.perf_counter() - started
+        totals['calls'] += 1
+        totals['rows_in'] += stage['rows_in']
+        totals['rows_out'] += stage['rows_out']
+
+
+def merge_run_stats(stats, other):
+    """Add the stage totals and counters of other into stats"""
+    for name, other_totals in other['stages'].items():
+        totals = stats['stages'].setdefault(name, {'seconds': 0.0, 'calls': 0, 'rows_in': 0, 'rows_out': 0})
+        for key, value in other_totals.items():
+            totals[key] += value
+    for name, value in other['counters'].items():
+        stats['counters'][name] += value
+
+
+def count_stat(stats, name, amount=1):
+    """Increment a run statistics counter, if statistics are being collected"""
+    if stats is not None:
+        stats['counters'][name] += amount
+
+
+def new_unmatched_names(limit=UNMATCHED_NAMES_LIMIT):
+    """Per-run tally of approver names not found in the employee database
+
+    Occurrences are counted per distinct name for at most limit names;
+    occurrences of further names only add to 'other', so memory stays bounded.
+    """
+    return {'counts': Counter(), 'limit': limit, 'other': 0}
+
+
+def count_unmatched_names(unmatched_names, names):
+    """Add occurrences of unmatched names, if unmatched names are being tracked"""
+    if unmatched_names is None:
+        return
+    counts = unmatched_names['counts']
+    for name in names:
+        if name in counts or len(counts) < unmatched_names['limit']:
+            counts[name] += 1
+        else:
+            unmatched_names['other'] += 1
+
+
+def merge_unmatched_names(unmatched_names, other):
+    """Add the tally of other into unmatched_names, keeping its limit"""
+    counts = unmatched_names['counts']
+    for name, count in other['counts'].items():
+        if name in counts or len(counts) < unmatched_names['limit']:
+            counts[name] += count
+        else:
+            unmatched_names['other'] += count
+    unmatched_names['other'] += other['other']
+
+
+def unmatched_names_csv(unmatched_names):
+    """Unmatched names with their occurrences as CSV text, most frequent first"""
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    writer.writerow(['name', 'occurrences'])
+    writer.writerows(unmatched_names['counts'].most_common())
+    return output.getvalue()
+
+
+def connect_employee_sqlite(path=EMPLOYEE_DB_SQLITE_FILE):
+    """Open the SQLite employee store, creating the schema if needed"""
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS employees (
+            email TEXT PRIMARY KEY,
+            normalized_surname TEXT,
+            company TEXT,
+            team_id TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_employees_surname ON employees (normalized_surname);
+        CREATE INDEX IF NOT EXISTS idx_employees_company ON employees (company);
+        CREATE INDEX IF NOT EXISTS idx_employees_team ON employees (team_id);
+        CREATE TABLE IF NOT EXISTS companies (name TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS teams (team_id TEXT PRIMARY KEY, emails TEXT NOT NULL);
+    """)
+    return conn
+
+
+def upsert_employees_sqlite(conn, employees, companies, teams=None):
+    """Insert or update employees by email, their teams and missing companies in one transaction"""
+    teams = teams or {}
+    team_ids = {employee.get('team_id') for employee in employees} & set(teams)
+    with conn:
+        conn.executemany(
+            """INSERT INTO employees (email, normalized_surname, company, team_id, data)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (email) DO UPDATE SET
+                   normalized_surname = excluded.normalized_surname, company = excluded.company,
+                   team_id = excluded.team_id, data = excluded.data""",
+            [(employee['email'], employee['normalized_surname'], employee['company'],
+              employee.get('team_id', ''), json.dumps(employee, ensure_ascii=False))
+             for employee in employees]
+        )
+        conn.executemany('INSERT OR IGNORE INTO companies (name) VALUES (?)',
+                         [(company,) for company in companies])
+        conn.executemany('INSERT OR REPLACE INTO teams (team_id, emails) VALUES (?, ?)',
+                         [(team_id, json.dumps(teams[team_id], ensure_ascii=False)) for team_id in sorted(team_ids)])
+
+
+def migrate_employee_json_to_sqlite(json_path=EMPLOYEE_DB_FILE, sqlite_path=EMPLOYEE_DB_SQLITE_FILE):
+    """Copy an existing JSON employee database into a new SQLite store
+
+    The JSON database is upgraded to EMPLOYEE_DB_SCHEMA_VERSION first, as
+    the store indexes fields older files do not have. The store is built
+    under a temporary name and only moved to sqlite_path once complete, so
+    a failed migration leaves no store behind and is retried on next read.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        db = json.load(f)
+    db.setdefault('teams', {})
+    db.setdefault('schema_version', 1)
+    upgrade_employee_db(db)
+
+    temp_path = f'{sqlite_path}.migrating'
+    remove_sqlite_files(temp_path)
+    try:
+        conn = connect_employee_sqlite(temp_path)
+        try:
+            upsert_employees_sqlite(conn, db['employees'], db['companies'], db['teams'])
+            conn.execute(f"PRAGMA user_version = {int(db['schema_version'])}")
+            # Leave no -wal file behind, the store is moved as a single file
+            conn.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            conn.close()
+        os.replace(temp_path, sqlite_path)
+    except BaseException:
+        remove_sqlite_files(temp_path)
+        raise
+
+
+def remove_sqlite_files(path):
+    """Delete a SQLite database and its -wal and -shm files, if present"""
+    for file_path in (path, f'{path}-wal', f'{path}-shm'):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+def read_employee_sqlite(path=EMPLOYEE_DB_SQLITE_FILE):
+    """Read the SQLite employee store, migrating the JSON database on first use"""
+    if not Path(path).exists() and Path(EMPLOYEE_DB_FILE).exists():
+        migrate_employee_json_to_sqlite(EMPLOYEE_DB_FILE, path)
+
+    conn = connect_employee_sqlite(path)
+    try:
+        # rowid order keeps employees in the order they were added
+        employees = [json.loads(data) for data, in conn.execute('SELECT data FROM employees ORDER BY rowid')]
+        companies = {name for name, in conn.execute('SELECT name FROM companies')}
+        teams = {team_id: json.loads(emails) for team_id, emails in conn.execute('SELECT team_id, emails FROM teams')}
+        schema_version, = conn.execute('PRAGMA user_version').fetchone()
+        db = {'schema_version': schema_version or 1, 'employees': employees, 'companies': companies, 'teams': teams}
+
+        changed_employees = upgrade_employee_db(db)
+        if changed_employees is not None:
+            upsert_employees_sqlite(conn, changed_employees, (), db['teams'])
+            conn.execute(f'PRAGMA user_version = {EMPLOYEE_DB_SCHEMA_VERSION}')
+    finally:
+        conn.close()
+    return db
+
+
+def read_employee_db(backend=EMPLOYEE_DB_BACKEND):
+    """Read the employee database from the configured backend, upgrading older files"""
+    if backend == 'sqlite':
+        return read_employee_sqlite()
+    if Path(EMPLOYEE_DB_FILE).exists():
+        with open(EMPLOYEE_DB_FILE, 'r', encoding='utf-8') as f:
+            db = json.load(f)
+        db['companies'] = set(db['companies'])
+        db.setdefault('teams', {})
+        db.setdefault('schema_version', 1)
+        if upgrade_employee_db(db) is not None:
+            write_employee_db(db, backend='json')
+        return db
+    return new_employee_db()
+
+
+def new_employee_db():
+    """Empty employee database"""
+    return {'schema_version': EMPLOYEE_DB_SCHEMA_VERSION, 'employees': [], 'companies': set(), 'teams': {}}
+
+
+def next_team_number(teams):
+    """First free number for a new 'team_<n>' id"""
+    numbers = [int(team_id[5:]) for team_id in teams if team_id.startswith('team_') and team_id[5:].isdigit()]
+    return max(numbers, default=0) + 1
+
+
+def migrate_legacy_teams(employees, teams):
+    """Move the team_emails list copied onto every member into teams, once per team
+
+    Older databases numbered teams from team_1 on every upload, so members of
+    different teams could share a team_id; records with the same team_id but
+    another team list get a new id. Returns the records that changed.
+    """
+    used_team_ids = set(teams) | {employee.get('team_id') for employee in employees
+                                  if 'team_emails' not in employee}
+    # New ids are numbered after every id in use or still to be migrated
+    all_team_ids = used_team_ids | {employee.get('team_id') for employee in employees}
+    team_number = next_team_number(all_team_ids - {None, ''})
+    new_team_ids = {}
+    changed_employees = []
+
+    for employee in employees:
+        if 'team_emails' not in employee:
+            continue
+        team_emails = employee.pop('team_emails')
+        changed_employees.append(employee)
+        if not employee.get('team_id'):
+            continue
+
+        key = (employee['team_id'], tuple(team_emails))
+        if key not in new_team_ids:
+            team_id = employee['team_id']
+            while team_id in used_team_ids:
+                team_id = f"team_{team_number}"
+                team_number += 1
+            used_team_ids.add(team_id)
+            new_team_ids[key] = team_id
+            teams[team_id] = list(team_emails)
+        employee['team_id'] = new_team_ids[key]
+
+    return changed_employees
+
+
+def upgrade_employee_db(db):
+    """Bring a database read from disk to EMPLOYEE_DB_SCHEMA_VERSION
+
+    Returns the employee records that changed, or None if db was up to date.
+    """
+    if db['schema_version'] >= EMPLOYEE_DB_SCHEMA_VERSION:
+        return None
+
+    changed_employees = []
+    if db['schema_version'] < 2:
+        changed_employees = migrate_legacy_teams(db['employees'], db['teams'])
+    if db['schema_version'] < 3:
+        for employee in db['employees']:
+            add_normalized_name_fields(employee)
+        changed_employees = db['employees']
+    db['schema_version'] = EMPLOYEE_DB_SCHEMA_VERSION
+    return changed_employees
+
+
+def employee_db_signature(backend=EMPLOYEE_DB_BACKEND):
+    """(mtime, size) of the employee database files, to tell when they change"""
+    if backend == 'sqlite':
+        paths = [EMPLOYEE_DB_SQLITE_FILE, EMPLOYEE_DB_SQLITE_FILE + '-wal']
+    else:
+        paths = [EMPLOYEE_DB_FILE]
+
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def write_employee_db(db, changed_employees=None, backend=EMPLOYEE_DB_BACKEND):
+    """Write the employee database to the configured backend
+
+    With the SQLite backend only changed_employees are written, or every
+    employee if they are not given.
+    """
+    if backend == 'sqlite':
+        conn = connect_employee_sqlite()
+        try:
+            upsert_employees_sqlite(conn, db['employees'] if changed_employees is None else changed_employees,
+                                    db['companies'], db.get('teams'))
+        finally:
+            conn.close()
+    else:
+        db_to_save = {
+            'schema_version': EMPLOYEE_DB_SCHEMA_VERSION,
+            'employees': db['employees'],
+            'companies': list(db['companies']),
+            'teams': db.get('teams', {})
+        }
+        with open(EMPLOYEE_DB_FILE, 'w', encoding='utf-8') as f:
+            json.dump(db_to_save, f, ensure_ascii=False, indent=2)
+
+
+class _NormalizeTable(dict):
+    """str.translate table deleting combining marks and characters other than word, space and '.'
+
+    Filled one code point at a time as characters are first seen.
+    """
+
+    def __missing__(self, code_point):
+        char = chr(code_point)
+        # Same classes as the regex [^\w\s.]: \w is isalnum() or '_', \s is isspace()
+        keep = not unicodedata.combining(char) and (char.isalnum() or char.isspace() or char in '_.')
+        self[code_point] = code_point if keep else None
+        return self[code_point]
+
+
+_normalize_table = _NormalizeTable()
+
+
+def normalize_text(text):
+    """Normalize text by removing accents, special characters, and converting to lowercase"""
+    if not isinstance(text, str):
+        return ""
+    return _normalize_str(text)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_str(text):
+    """normalize_text for strings, cached as the same approver names recur across rows"""
+    # NFKD leaves ASCII unchanged
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+    return text.translate(_normalize_table).lower().strip()
+
+
+def is_initial(part):
+    """Check if a name part is an initial"""
+    return len(part) <= 2 or (len(part) == 2 and part.endswith('.'))
+
+
+def extract_name_components(name):
+    """Extract surname and given names from a full name with proper handling of initials"""
+    if not isinstance(name, str):
+        return "", ""
+
+    clean_name = re.sub(r'[^а-яА-ЯёЁa-zA-Z\s.]', '', name).strip()
+
+    if ',' in clean_name:
+        parts = [p.strip() for p in clean_name.split(',')]
+        if len(parts) >= 2:
+            return parts[0], parts[1]
+
+    parts = [p for p in re.split(r'\s+', clean_name) if p]
+
+    if not parts:
+        return "", ""
+    if len(parts) == 1:
+        return parts[0], ""
+
+    if is_initial(parts[-1]):
+        return parts[0], parts[-1]
+
+    if is_initial(parts[0]):
+        return parts[-1], parts[0]
+
+    return parts[-1], " ".join(parts[:-1])
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def target_name_forms(target_name):
+    """(normalized surname, normalized given names) of a name being matched"""
+    surname, given_names = extract_name_components(target_name)
+    return normalize_text(surname), normalize_text(given_names)
+
+
+def employee_name_fields(name):
+    """Name fields of an employee record, with the normalized forms matching needs"""
+    surname, given_names = extract_name_components(name)
+    return {
+        'name': name, 'normalized_name': normalize_text(name),
+        'surname': surname, 'given_names': given_names,
+        'normalized_surname': normalize_text(surname), 'normalized_given_names': normalize_text(given_names)
+    }
+
+
+def add_normalized_name_fields(employee):
+    """Fill in the normalized surname and given names of a record stored without them"""
+    employee['normalized_surname'] = normalize_text(employee['surname'])
+    employee['normalized_given_names'] = normalize_text(employee['given_names'])
+    return employee
+
+
+def iter_contact_cells(file):
+    """Yield the cells of a contact sheet as text, row by row, like df.astype(str) of the whole sheet
+
+    CSV is read in chunks and XLSX through a read-only openpyxl workbook.
+    """
+    if file.name.endswith('.csv'):
+        for chunk in pd.read_csv(file, sep=';', encoding='utf-8', chunksize=CONTACT_CHUNK_SIZE):
+            yield from chunk.astype(str).values.flat
+        return
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        next(rows, None)  # pandas.read_excel takes the first row as column names
+        empty_rows = []
+        for row in rows:
+            cells = ['nan' if value is None else str(value) for value in row]
+            # pandas.read_excel drops trailing empty rows, so hold them back until more data follows
+            if all(value is None for value in row):
+                empty_rows.append(cells)
+                continue
+            for empty_row in empty_rows:
+                yield from empty_row
+            empty_rows = []
+            yield from cells
+    finally:
+        workbook.close()
+
+
+def iter_combined_lines(cells):
+    """Split cells into lines, joining lines continued with a trailing '/'"""
+    current_combined_line = ""
+
+    for cell in cells:
+        for line in cell.split('\n'):
+            line = line.strip()
+            if not line:
+                if current_combined_line:
+                    yield current_combined_line
+                    current_combined_line = ""
+                continue
+
+            if current_combined_line:
+                if current_combined_line.endswith('/'):
+                    current_combined_line = current_combined_line.rstrip('/') + ' ' + line
+                else:
+                    yield current_combined_line
+                    current_combined_line = line
+            else:
+                current_combined_line = line
+
+    if current_combined_line:
+        yield current_combined_line
+
+
+def iter_contact_blocks(combined_lines, stats=None):
+    """Yield (line, [(name, email), ...]) for each contact block in combined contact lines"""
+    block_count = 0
+    line_num = 0
+
+    for line_num, line in enumerate(combined_lines, 1):
+        # Lines without an address cannot hold a block, skip the block regex for them
+        if '@' not in line:
+            continue
+
+        for block in CONTACT_BLOCK_PATTERN.findall(line):
+            if '@' not in block:
+                continue
+
+            block_count += 1
+            persons = []
+            for person in block.split('/'):
+                match = CONTACT_PERSON_PATTERN.search(person.strip())
+                if not match:
+                    continue
+                name, email = match.group(1).strip(), match.group(2).strip()
+                persons.append((name, EMAIL_TRAILING_PATTERN.sub('', email).strip()))
+            yield line, persons
+
+    count_stat(stats, 'contact_lines', line_num)
+    count_stat(stats, 'contact_blocks', block_count)
+
+
+def extract_employees(combined_lines, seen_emails, skip_emails=(), stats=None, teams=None):
+    """Extract employees and their teams from combined contact lines
+
+    Returns (employees, manual_assignments, companies): employees with a
+    corporate domain as their company, public-domain addresses that need a
+    company assigned by hand (keyed by email), and the company domains found.
+    seen_emails is updated with every extracted address. Each team's email
+    list is added to teams (the database's team lists) under an id not yet
+    used there.
+    """
+    return employees_from_contact_blocks(iter_contact_blocks(combined_lines, stats), seen_emails, skip_emails,
+                                         stats, teams)
+
+
+def employees_from_contact_blocks(contact_blocks, seen_emails, skip_emails=(), stats=None, teams=None):
+    """extract_employees for contact blocks from iter_contact_blocks"""
+    employees = []
+    manual_assignments = {}
+    companies = set()
+    if teams is None:
+        teams = {}
+    team_id_counter = next_team_number(teams)
+
+    for line, persons in contact_blocks:
+        team_id = f"team_{team_id_counter}"
+
+        team_company = None
+        team_emails = []
+
+        for name, email in persons:
+            # Skip if already processed in this session
+            if email in skip_emails:
+                continue
+
+            if email in seen_emails:
+                continue
+            seen_emails.add(email)
+            team_emails.append(email)
+
+            domain = email.split('@')[-1].split('.')[0]
+            name_fields = employee_name_fields(name)
+
+            if domain in public_domains:
+                # Store for manual assignment
+                manual_assignments[email] = {
+                    **name_fields, 'email': email, 'team_id': team_id, 'line': line
+                }
+            else:
+                if team_company is None:
+                    team_company = domain
+                    companies.add(domain)
+
+                employees.append({
+                    **name_fields, 'email': email, 'company': domain, 'source': 'auto', 'team_id': team_id
+                })
+
+        if team_emails:
+            teams[team_id] = team_emails
+            team_id_counter += 1
+
+    count_stat(stats, 'employees_extracted', len(employees))
+    count_stat(stats, 'manual_assignments', len(manual_assignments))
+    return employees, manual_assignments, companies
+
+
+def read_contact_blocks(file_name, content, collect_stats=False):
+    """Pool task: the contact blocks of one contact file given as bytes, and its statistics"""
+    file = io.BytesIO(content)
+    file.name = file_name
+    stats = new_run_stats() if collect_stats else None
+    return list(iter_contact_blocks(iter_combined_lines(iter_contact_cells(file)), stats)), stats
+
+
+def extract_employees_bulk(contact_files, seen_emails, skip_emails=(), stats=None, teams=None, workers=None):
+    """extract_employees for several contact files imported together
+
+    contact_files is a list of (file name, content bytes). The files are
+    read and split into contact blocks in parallel worker processes, then
+    deduplicated by email across all of them in one pass in file order,
+    so an address keeps the first file it appears in. Manual assignments
+    record their file under 'file'.
+    """
+    file_names = [file_name for file_name, _ in contact_files]
+    contents = [content for _, content in contact_files]
+    collect_stats = stats is not None
+    if len(contact_files) > 1:
+        with ProcessPoolExecutor(min(workers or os.cpu_count() or 1, len(contact_files))) as pool:
+            parsed_files = list(pool.map(read_contact_blocks, file_names, contents, [collect_stats] * len(contents)))
+    else:
+        parsed_files = [read_contact_blocks(file_name, content, collect_stats)
+                        for file_name, content in contact_files]
+
+    employees = []
+    manual_assignments = {}
+    companies = set()
+    for file_name, (contact_blocks, file_stats) in zip(file_names, parsed_files):
+        if file_stats is not None:
+            merge_run_stats(stats, file_stats)
+        file_employees, file_manual_assignments, file_companies = employees_from_contact_blocks(
+            contact_blocks, seen_emails, skip_emails, stats, teams
+        )
+        employees.extend(file_employees)
+        for email, data in file_manual_assignments.items():
+            manual_assignments[email] = {**data, 'file': file_name}
+        companies |= file_companies
+    return employees, manual_assignments, companies
+
+
+def build_company_person_map(employees):
+    """Group employee records by company for matching
+
+    The records themselves are grouped, not copies, so the database and the
+    match index share one dict per employee.
+    """
+    company_person_map = defaultdict(list)
+    for employee in employees:
+        company_person_map[employee['company']].append(employee)
+    return company_person_map
+
+
+def build_match_index(candidates, teams=None, previous_index=None):
+    """Build a surname index for find_best_match from the candidate list
+
+    Team sizes come from teams (the database's team lists) where given,
+    else from the team_emails list of records in the older format, else
+    from the candidates sharing a team_id. Candidates stored without
+    normalized name parts get them filled in. With previous_index, the
+    index of an earlier version of the database, the fuzzy index is
+    extended with new names instead of being rebuilt.
+    """
+    by_surname = defaultdict(list)
+    for candidate in candidates:
+        if 'normalized_surname' not in candidate:
+            add_normalized_name_fields(candidate)
+        by_surname[candidate['normalized_surname']].append((candidate, candidate['normalized_given_names']))
+    by_email = {}
+    team_members = defaultdict(list)
+    for candidate in candidates:
+        by_email.setdefault(candidate['email'], candidate)
+        if candidate.get('team_id'):
+            team_members[candidate['team_id']].append(candidate)
+    team_sizes = {team_id: len(members) for team_id, members in team_members.items()}
+    # Team lists count public-domain members that are not in the database
+    team_sizes.update((candidate['team_id'], len(candidate['team_emails'])) for candidate in candidates
+                      if candidate.get('team_id') and 'team_emails' in candidate)
+    if teams is not None:
+        team_sizes.update((team_id, len(teams[team_id])) for team_id in team_sizes if team_id in teams)
+    normalized_names = [candidate['normalized_name'] for candidate in candidates]
+    fuzzy_index, fuzzy_slots, fuzzy_positions = extend_fuzzy_index(candidates, previous_index)
+    return {
+        'people': candidates,
+        'normalized_names': normalized_names,
+        'by_surname': dict(by_surname),
+        'by_email': by_email,
+        'team_members': dict(team_members),
+        'team_sizes': team_sizes,
+        'fuzzy_index': fuzzy_index,
+        'fuzzy_slots': fuzzy_slots,
+        'fuzzy_positions': fuzzy_positions
+    }
+
+
+def extend_fuzzy_index(candidates, previous_index=None):
+    """(fuzzy index, slots by email and name, position of each slot's candidate) for the candidates
+
+    Candidates with the same email and normalized name as one in
+    previous_index keep that one's fuzzy index entry, so only new or changed
+    names are profiled. Entries of removed candidates stay in the index at
+    position -1; once they outnumber the candidates the index is rebuilt.
+    The previous index is copied, not changed, as runs may still be using it.
+    """
+    if previous_index is None or previous_index['fuzzy_index']['size'] > 2 * len(candidates):
+        fuzzy_index = new_fuzzy_index()
+        previous_slots = {}
+    else:
+        fuzzy_index = copy_fuzzy_index(previous_index['fuzzy_index'])
+        previous_slots = previous_index['fuzzy_slots']
+
+    slots = defaultdict(list)
+    candidate_slots = []
+    new_names = []
+    for candidate in candidates:
+        key = (candidate['email'], candidate['normalized_name'])
+        reusable = previous_slots.get(key, ())
+        if len(slots[key]) < len(reusable):
+            slot = reusable[len(slots[key])]
+        else:
+            slot = fuzzy_index['size'] + len(new_names)
+            new_names.append(candidate['normalized_name'])
+        slots[key].append(slot)
+        candidate_slots.append(slot)
+    add_fuzzy_index_names(fuzzy_index, new_names)
+
+    positions = np.full(fuzzy_index['size'], -1, dtype=np.intp)
+    positions[np.array(candidate_slots, dtype=np.intp)] = np.arange(len(candidates))
+    return fuzzy_index, dict(slots), positions
+
+
+def token_set_profile(normalized_name):
+    """(tokens, length, character counts) of a name as token_set_ratio compares it
+
+    token_set_ratio compares the name's unique tokens joined by single spaces,
+    so the length and character counts are those of that string.
+    """
+    tokens = set(normalized_name.split())
+    char_counts = Counter(''.join(tokens))
+    if len(tokens) > 1:
+        char_counts[' '] = len(tokens) - 1
+    return tokens, sum(char_counts.values()), char_counts
+
+
+def new_fuzzy_index():
+    """Empty candidate pruning index for fuzzy name matching"""
+    return {'size': 0, 'lengths': [], 'by_token': {}, 'by_char': {}, 'arrays': {}}
+
+
+def copy_fuzzy_index(fuzzy_index):
+    """Copy of a fuzzy index that can be added to without changing the original"""
+    return {
+        'size': fuzzy_index['size'], 'lengths': list(fuzzy_index['lengths']),
+        'by_token': {token: list(positions) for token, positions in fuzzy_index['by_token'].items()},
+        'by_char': {char: (list(positions), list(counts))
+                    for char, (positions, counts) in fuzzy_index['by_char'].items()},
+        'arrays': {}
+    }
+
+
+def add_fuzzy_index_names(fuzzy_index, normalized_names):
+    """Append candidates' normalized names to the fuzzy index, after those already in it"""
+    for normalized_name in normalized_names:
+        position = fuzzy_index['size']
+        tokens, length, char_counts = token_set_profile(normalized_name)
+        fuzzy_index['lengths'].append(length)
+        for token in tokens:
+            fuzzy_index['by_token'].setdefault(token, []).append(position)
+        for char, count in char_counts.items():
+            positions, counts = fuzzy_index['by_char'].setdefault(char, ([], []))
+            positions.append(position)
+            counts.append(count)
+        fuzzy_index['size'] += 1
+    fuzzy_index['arrays'].clear()
+
+
+def _fuzzy_index_array(fuzzy_index, key, build):
+    """numpy form of an index list, built on first use after each addition
+
+    Batch matching reads the index from several threads; at worst two of
+    them build the same array.
+    """
+    array = fuzzy_index['arrays'].get(key)
+    if array is None:
+        array = fuzzy_index['arrays'][key] = build()
+    return array
+
+
+def fuzzy_shortlist(fuzzy_index, target_name_norm, threshold=MATCH_SCORE_THRESHOLD):
+    """Positions, in index order, of every candidate whose token_set_ratio could exceed threshold
+
+    Candidates sharing a token with the target are always kept, as
+    token_set_ratio can score them up to 100 whatever the rest of the names.
+    Otherwise it scores the two whole token strings, 100 * 2 * LCS / (sum of
+    lengths), and their longest common subsequence is at most the number of
+    characters they have in common, so candidates whose character overlap
+    cannot reach the threshold are dropped without losing a match.
+    """
+    tokens, length, char_counts = token_set_profile(target_name_norm)
+    lengths = _fuzzy_index_array(fuzzy_index, 'lengths', lambda: np.array(fuzzy_index['lengths'], dtype=np.int32))
+    shared = np.zeros(fuzzy_index['size'], dtype=np.int32)
+    for char, count in char_counts.items():
+        if char not in fuzzy_index['by_char']:
+            continue
+        positions, counts = _fuzzy_index_array(
+            fuzzy_index, char, lambda: tuple(np.array(values, dtype=np.int32) for values in fuzzy_index['by_char'][char])
+        )
+        shared[positions] += np.minimum(counts, count)
+
+    keep = 200 * shared >= threshold * (lengths + length)
+    for token in tokens:
+        keep[fuzzy_index['by_token'].get(token, [])] = True
+    return np.flatnonzero(keep)
+
+
+def shortlist_positions(match_index, target_name_norm):
+    """Positions in match_index['people'], in order, of the fuzzy_shortlist for a name"""
+    positions = match_index['fuzzy_positions'][fuzzy_shortlist(match_index['fuzzy_index'], target_name_norm)]
+    return np.sort(positions[positions >= 0])
+
+
+def find_surname_match(target_name, candidates, match_index=None):
+    """Find the first candidate with the same surname and compatible given names"""
+    target_surname_norm, target_given_norm = target_name_forms(target_name)
+
+    if match_index is not None:
+        # Candidates sharing the surname, in their original order
+        surname_candidates = match_index['by_surname'].get(target_surname_norm, [])
+    else:
+        surname_candidates = [(candidate, normalize_text(candidate['given_names']))
+                              for candidate in candidates
+                              if normalize_text(candidate['surname']) == target_surname_norm]
+
+    for candidate, candidate_given_norm in surname_candidates:
+        if (candidate_given_norm.startswith(target_given_norm) or
+                target_given_norm.startswith(candidate_given_norm)):
+            return candidate
+
+    return None
+
+
+def find_best_match(target_name, candidates, debug_info=None, match_index=None):
+    """Find the best match using fuzzy matching on full name"""
+    if debug_info is None:
+        debug_info = []
+
+    surname_match = find_surname_match(target_name, candidates, match_index)
+    if surname_match:
+        return surname_match
+
+    return find_fuzzy_match(target_name, candidates, match_index)
+
+
+def find_fuzzy_match(target_name, candidates, match_index=None):
+    """Find the first best-scoring candidate above MATCH_SCORE_THRESHOLD
+
+    With a match_index, candidates are its people and only their fuzzy_shortlist
+    is scored.
+    """
+    best_score = 0
+    best_match = None
+    target_name_norm = normalize_text(target_name)
+    if match_index is not None:
+        people = match_index['people']
+        candidates = [people[position] for position in shortlist_positions(match_index, target_name_norm)]
+    for candidate in candidates:
+        score = fuzz.token_set_ratio(target_name_norm, candidate['normalized_name'])
+        if score > MATCH_SCORE_THRESHOLD and score > best_score:
+            best_score = score
+            best_match = candidate
+
+    return best_match
+
+
+def checked_team_members(checked_approvers, team_id, match_index, team_match_cache):
+    """Emails of the team's members that any checked approver name matches
+
+    Results are cached per normalized name and team, so each pair is scored
+    once per run against the team's members only.
+    """
+    checked_emails = set()
+    for checked_name in checked_approvers:
+        key = (normalize_text(checked_name), team_id)
+        if key not in team_match_cache:
+            team_match_cache[key] = {member['email'] for member in match_index['team_members'][team_id]
+                                     if find_best_match(checked_name, [member])}
+        checked_emails |= team_match_cache[key]
+    return checked_emails
+
+
+def score_fuzzy_names(target_names, match_index):
+    """Best candidate above MATCH_SCORE_THRESHOLD, or None, for each name, scored against its shortlist"""
+    people = match_index['people']
+    normalized_names = match_index['normalized_names']
+    matches = {}
+    for target_name in target_names:
+        matches[target_name] = None
+        target_name_norm = normalize_text(target_name)
+        shortlist = shortlist_positions(match_index, target_name_norm)
+        if not len(shortlist):
+            continue
+        scores = process.cdist([target_name_norm], [normalized_names[position] for position in shortlist],
+                               scorer=fuzz.token_set_ratio)[0]
+        # argmax picks the first best-scoring candidate, like the sequential loop
+        best_position = np.argmax(scores)
+        if scores[best_position] > MATCH_SCORE_THRESHOLD:
+            matches[target_name] = people[shortlist[best_position]]
+    return matches
+
+
+def find_best_matches_batch(target_names, match_index, stats=None, workers=None):
+    """Resolve many names at once, scoring the fuzzy fallbacks on all cores
+
+    Fallbacks are scored against their shortlists in tasks of
+    FUZZY_BATCH_SIZE names on a pool of workers threads (one per core by
+    default); rapidfuzz releases the GIL while scoring. Process pool
+    workers pass 1, as their siblings already use the other cores.
+    """
+    people = match_index['people']
+    matches = {}
+    fuzzy_names = []
+
+    for target_name in dict.fromkeys(target_names):
+        matches[target_name] = find_surname_match(target_name, people, match_index)
+        if matches[target_name] is None:
+            fuzzy_names.append(target_name)
+    count_stat(stats, 'surname_hits', len(matches) - len(fuzzy_names))
+    count_stat(stats, 'fuzzy_fallbacks', len(fuzzy_names))
+
+    if not people:
+        count_stat(stats, 'unmatched_names', len(fuzzy_names))
+        return matches
+
+    batches = [fuzzy_names[start:start + FUZZY_BATCH_SIZE] for start in range(0, len(fuzzy_names), FUZZY_BATCH_SIZE)]
+    score_batch = partial(score_fuzzy_names, match_index=match_index)
+    workers = min(len(batches), workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as executor:
+            for batch_matches in executor.map(score_batch, batches):
+                matches.update(batch_matches)
+    else:
+        for batch in batches:
+            matches.update(score_batch(batch))
+
+    count_stat(stats, 'unmatched_names', sum(matches[name] is None for name in fuzzy_names))
+    return matches
+
+
+def add_working_days(start_date, working_days):
+    """Add working days excluding weekends"""
+    if working_days <= 0:
+        return start_date
+
+    current_date = start_date
+    days_added = 0
+
+    while days_added < working_days:
+        current_date += timedelta(days=1)
+        monthday = current_date.strftime("%d-%m")
+        if (current_date.weekday() < 5) and (monthday not in holidays):
+            days_added += 1
+        elif monthday in working_holidays:
+            days_added += 1
+
+    return current_date
+
+
+@lru_cache(maxsize=16)
+def business_calendar(first_year, last_year, holiday_dates, working_holiday_dates):
+    """Build a numpy business-day calendar with the same working days as add_working_days"""
+    days = np.arange(np.datetime64(f'{first_year}-01-01'), np.datetime64(f'{last_year + 1}-01-01'))
+    months = days.astype('datetime64[M]')
+    # Encode each day as DDMM to compare against the 'DD-MM' holiday lists
+    monthdays = (days - months).astype('int64') * 100 + 100 + months.astype('int64') % 12 + 1
+    weekdays = (days.astype('int64') + 3) % 7  # 1970-01-01 was a Thursday
+
+    def encode(dates):
+        return [int(day) * 100 + int(month) for day, month in (date.split('-') for date in dates)]
+
+    working = (((weekdays < 5) & ~np.isin(monthdays, encode(holiday_dates))) |
+               np.isin(monthdays, encode(working_holiday_dates)))
+    # Every day is in the weekmask; weekends and holidays come in as holiday dates
+    return np.busdaycalendar(weekmask='1111111', holidays=days[~working])
+
+
+def compute_deadlines(start_dates, working_days):
+    """Vectorized add_working_days: deadline dates for arrays of start dates and working days"""
+    start_days = np.asarray(start_dates, dtype='datetime64[D]')
+    working_days = np.asarray(working_days, dtype='int64')
+    deadlines = start_days.copy()
+
+    to_offset = working_days > 0
+    if to_offset.any():
+        years = start_days[to_offset].astype('datetime64[Y]').astype('int64') + 1970
+        last_year = int(years.max()) + int(working_days.max()) // 200 + 1
+        calendar = business_calendar(int(years.min()), last_year, tuple(holidays), tuple(working_holidays))
+        # Rolling backward makes a start on a day off count from the next working day, as the loop does
+        deadlines[to_offset] = np.busday_offset(start_days[to_offset], working_days[to_offset],
+                                                roll='backward', busdaycal=calendar)
+
+    return deadlines
+
+
+def load_stage_rules(path=STAGE_RULES_FILE):
+    """Load the stage working-day rules, with integer stage keys
+
+    The file gives the approval step marker with its stage and days, the
+    default days per stage, and per configured stage the workflow keywords
+    with their days, in priority order.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return {
+        'approval': config['approval'],
+        'default_days': {int(stage): days for stage, days in config['default_days'].items()},
+        'stages': {int(stage): keywords for stage, keywords in config['stages'].items()}
+    }
+
+
+@lru_cache(maxsize=1)
+def stage_rules(path=STAGE_RULES_FILE):
+    """Stage rules loaded once, with each stage's keywords compiled into one matcher
+
+    The matcher is a lookahead alternation of the lowercased keywords in
+    config order, so one scan finds, at every position, the highest-priority
+    keyword starting there.
+    """
+    rules = load_stage_rules(path)
+    rules['matchers'] = {
+        stage: re.compile('(?=(' + ')|('.join(re.escape(keyword.lower()) for keyword in keywords) + '))')
+        for stage, keywords in rules['stages'].items() if keywords
+    }
+    return rules
+
+
+def match_stage_keyword(rules, stage_number, workflow_text):
+    """First configured keyword of the stage found in the workflow text, or None"""
+    matcher = rules['matchers'].get(stage_number)
+    if matcher is None:
+        return None
+
+    best_priority = None
+    for match in matcher.finditer(workflow_text.lower()):
+        priority = match.lastindex - 1
+        if best_priority is None or priority < best_priority:
+            best_priority = priority
+            if priority == 0:
+                break
+    if best_priority is None:
+        return None
+    return list(rules['stages'][stage_number])[best_priority]
+
+
+@lru_cache(maxsize=WORKING_DAYS_CACHE_SIZE)
+def get_working_days(step_text, workflow_text):
+    """Calculate working days based on stage and specification keywords
+
+    Results are cached, as exports repeat a few step and workflow texts.
+    """
+    rules = stage_rules()
+    approval = rules['approval']
+    if approval['marker'] in step_text:
+        return (approval['days'], approval['stage'], f"Stage {approval['stage']}")
+
+    stage_match = STEP_NUMBER_PATTERN.search(step_text)
+    if not stage_match:
+        return (0, 0, "No stage number found")
+
+    step_number = int(stage_match.group(1))
+    stage_number = step_number + 1
+
+    default_days = rules['default_days']
+
+    if stage_number not in rules['stages']:
+        days = default_days.get(stage_number, 0)
+        return (days, stage_number, f"Stage {stage_number}: not configured, using default {days} days")
+
+    keyword = match_stage_keyword(rules, stage_number, workflow_text)
+    if keyword is not None:
+        days = rules['stages'][stage_number][keyword]
+        return (days, stage_number, f"Stage {stage_number}: keyword '{keyword}' → {days} days")
+
+    days = default_days.get(stage_number, 0)
+    return (days, stage_number, f"Stage {stage_number}: no keywords found, using default {days} days")
+
+
+def lifecycle_step_number(step_text):
+    """Step number used to look up the lifecycle, or None if the step has no number"""
+    approval = stage_rules()['approval']
+    if approval['marker'] in step_text:
+        return approval['stage'] - 1
+
+    step_match = STEP_NUMBER_PATTERN.search(step_text)
+    if step_match:
+        return int(step_match.group(1))
+    return None
+
+
+@lru_cache(maxsize=LIFECYCLE_CACHE_SIZE)
+def parse_lifecycle(lifecycle_text):
+    """Read lifecycle text in one pass into step -> timestamps that follow that step
+
+    Each step mention gets the first timestamp starting after it (None if
+    unparseable). Steps are keyed by digit prefix, so 'Шаг 1' also collects
+    from 'Шаг 12', and 'Шаг 412.01.25 10:00' gives step 4 the timestamp
+    12.01.25 10:00, as the per-step search 'Шаг 4.*?<timestamp>' did.
+    """
+    steps = defaultdict(list)
+    # (step, position where its digits end) for mentions still waiting for a timestamp
+    pending_steps = []
+
+    for match in LIFECYCLE_TOKEN_PATTERN.finditer(lifecycle_text):
+        step_digits, date_str = match.groups()
+        if step_digits is not None:
+            digits_start = match.start(1)
+            pending_steps.extend((step_digits[:length], digits_start + length)
+                                 for length in range(1, len(step_digits) + 1))
+            continue
+        ready_steps = dict.fromkeys(step for step, end in pending_steps if end <= match.start())
+        if not ready_steps:
+            continue
+
+        try:
+            timestamp = datetime.strptime(date_str, '%d.%m.%y %H:%M')
+        except ValueError:
+            timestamp = None
+        for step in ready_steps:
+            steps[step].append(timestamp)
+        # Other mentions of these steps before the timestamp end with it too
+        pending_steps = [(step, end) for step, end in pending_steps if step not in ready_steps]
+
+    return dict(steps)
+
+
+def extract_start_date_from_lifecycle(lifecycle_text, current_step_number):
+    """Extract start date from lifecycle text"""
+    if not lifecycle_text or pd.isna(lifecycle_text) or current_step_number is None:
+        return None
+
+    current_stage = current_step_number + 1
+    target_step = current_stage - 2
+
+    if target_step < 0:
+        return None
+
+    timestamps = parse_lifecycle(lifecycle_text).get(str(target_step))
+    return timestamps[-1] if timestamps else None
+
+
+def lifecycle_start_dates(lifecycle_texts, step_texts):
+    """Extract start dates for a whole 'Жизненный цикл' column"""
+    return pd.to_datetime(pd.Series(
+        [extract_start_date_from_lifecycle(str(lifecycle_text), lifecycle_step_number(step_text))
+         if pd.notna(lifecycle_text) and lifecycle_text else None
+         for lifecycle_text, step_text in zip(lifecycle_texts, step_texts)],
+        index=lifecycle_texts.index, dtype=object
+    ))
+
+
+def employee_db_hash(all_people):
+    """Hash the employee fields that name matching depends on"""
+    digest = hashlib.sha256()
+    for person in all_people:
+        fields = [person['email'], person['company'], person['normalized_name'],
+                  person['surname'], person['given_names']]
+        digest.update(json.dumps(fields, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def new_match_cache(db_hash=None):
+    """Create an empty name resolution cache"""
+    return {'db_hash': db_hash, 'matches': {}, 'lookups': 0, 'misses': 0}
+
+
+def load_match_cache(path=MATCH_CACHE_FILE):
+    """Load a persisted name resolution cache, or an empty one"""
+    match_cache = new_match_cache()
+    try:
+        if Path(path).exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            match_cache['db_hash'] = data['db_hash']
+            match_cache['matches'] = data['matches']
+    except (OSError, ValueError, KeyError):
+        pass
+    return match_cache
+
+
+def save_match_cache(match_cache, path=MATCH_CACHE_FILE):
+    """Persist the name resolution cache next to the employee database"""
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'db_hash': match_cache['db_hash'], 'matches': match_cache['matches']},
+                      f, ensure_ascii=False)
+        return True
+    except OSError:
+        return False
+
+
+def deadline_config_hash():
+    """Hash the settings deadlines depend on: holidays and stage working days"""
+    # The cached rules get_working_days uses, so stored rows are stamped with the rules they were computed with
+    rules = stage_rules()
+    config = [ROW_STATE_VERSION, holidays, working_holidays,
+              {key: rules[key] for key in ('approval', 'default_days', 'stages')}]
+    return hashlib.sha256(json.dumps(config, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def new_row_state(db_hash=None):
+    """Create an empty per-row result store for incremental processing
+
+    'previous' holds the entries of the last run by row fingerprint and
+    'rows' the entries of the current run, so rows that left the export are
+    dropped when the state is saved.
+    """
+    return {'db_hash': db_hash, 'config_hash': deadline_config_hash(), 'previous': {}, 'rows': {},
+            'reused': 0, 'computed': 0}
+
+
+def load_row_state(path=ROW_STATE_FILE):
+    """Load the per-row results of the previous run, or an empty store"""
+    row_state = new_row_state()
+    try:
+        if Path(path).exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # Stored deadlines are only valid for the same holidays and stage settings
+            if data['config_hash'] == row_state['config_hash']:
+                row_state['db_hash'] = data['db_hash']
+                row_state['previous'] = data['rows']
+    except (OSError, ValueError, KeyError):
+        pass
+    return row_state
+
+
+def save_row_state(row_state, path=ROW_STATE_FILE):
+    """Persist the per-row results of the current run next to the employee database"""
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'config_hash': row_state['config_hash'], 'db_hash': row_state['db_hash'],
+                       'rows': row_state['rows']}, f, ensure_ascii=False)
+        return True
+    except OSError:
+        return False
+
+
+def row_fingerprints(df):
+    """Fingerprint each row as its coordination id plus a hash of the columns its result depends on"""
+    id_column = df.columns[0]
+    columns = [id_column] + [column for column in FINGERPRINT_COLUMNS if column in df.columns]
+    row_hashes = pd.util.hash_pandas_object(df[columns].astype(str), index=False)
+    return [f'{coord_id}:{row_hash:016x}' for coord_id, row_hash in zip(df[id_column], row_hashes)]
+
+
+def resolve_approver(approver_name, all_people, match_index, match_cache, matching_log=None, stats=None):
+    """Find the best match for an approver, resolving each normalized name once"""
+    match_cache['lookups'] += 1
+    key = normalize_text(approver_name)
+    if key in match_cache['matches']:
+        email = match_cache['matches'][key]
+        return match_index['by_email'].get(email) if email else None
+
+    match_cache['misses'] += 1
+    best_match = find_surname_match(approver_name, all_people, match_index)
+    if best_match:
+        count_stat(stats, 'surname_hits')
+    else:
+        count_stat(stats, 'fuzzy_fallbacks')
+        best_match = find_fuzzy_match(approver_name, all_people, match_index)
+        if not best_match:
+            count_stat(stats, 'unmatched_names')
+    match_cache['matches'][key] = best_match['email'] if best_match else None
+    return best_match
+
+
+def parse_creation_dates(values):
+    """Parse the coordination creation dates column, unparseable values become NaT"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values.astype(str), format='%Y-%m-%d %H:%M:%S', errors='coerce')
+
+
+def is_team_checked(approver_name, all_people, checked_approvers, matching_log, match_index=None,
+                    match_cache=None, team_match_cache=None, stats=None):
+    """Check if any team member is already checked
+
+    With a match_index and team_match_cache, team members come from the
+    prebuilt team map and name/team results are reused across rows.
+    """
+    if match_cache is not None:
+        best_match = resolve_approver(approver_name, all_people, match_index, match_cache, matching_log, stats)
+    else:
+        best_match = find_best_match(approver_name, all_people, matching_log, match_index)
+    if not best_match:
+        return False
+
+    team_id = best_match.get('team_id')
+    if not team_id:
+        return False
+
+    if match_index is not None:
+        team_members = match_index['team_members'].get(team_id, [])
+        team_size = match_index['team_sizes'].get(team_id, 0)
+    else:
+        team_members = [person for person in all_people if person.get('team_id') == team_id]
+        team_size = len(team_members)
+
+    if team_size <= 1:
+        return False
+
+    if match_index is not None and team_match_cache is not None:
+        return bool(checked_team_members(checked_approvers, team_id, match_index, team_match_cache))
+
+    for team_member in team_members:
+        for checked_name in checked_approvers:
+            if find_best_match(checked_name, [team_member], matching_log):
+                return True
+
+    return False
+
+
+def coordination_deadlines(df, stats=None):
+    """Working days, start dates and deadlines for the rows of a coordination export
+
+    Returns (stage_days, start_dates, positions, deadlines): get_working_days
+    results per row, start dates per row (NaT if unknown), and the positions
+    of the dated rows with their deadlines.
+    """
+    step_texts = df['Шаг'].astype(str).tolist()
+    workflow_texts = df['Рабочий процесс'].astype(str).tolist()
+
+    with stage_timer(stats, 'working_days', len(df)) as stage:
+        stage_days = [get_working_days(step_text, workflow_text)
+                      for step_text, workflow_text in zip(step_texts, workflow_texts)]
+        working_days = np.array([days for days, _, _ in stage_days], dtype='int64')
+        stage['rows_out'] = len(stage_days)
+
+    # Start from the lifecycle date of the previous step, else from the creation date
+    with stage_timer(stats, 'start_dates', len(df)) as stage:
+        if 'Дата и время создания согласования' in df.columns:
+            start_dates = parse_creation_dates(df['Дата и время создания согласования'])
+        else:
+            start_dates = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        if 'Жизненный цикл' in df.columns:
+            lifecycle_dates = lifecycle_start_dates(df['Жизненный цикл'], step_texts)
+            start_dates = lifecycle_dates.where(lifecycle_dates.notna(), start_dates)
+        positions = np.flatnonzero(start_dates.notna().to_numpy())
+        stage['rows_out'] = len(positions)
+
+    # Deadlines for all dated rows in a single business-day offset
+    with stage_timer(stats, 'deadlines', len(positions)) as stage:
+        deadlines = compute_deadlines(start_dates.to_numpy()[positions], working_days[positions])
+        stage['rows_out'] = len(deadlines)
+    return stage_days, start_dates, positions, deadlines
+
+
+def incremental_deadlines(df, row_state, stats=None):
+    """coordination_deadlines that reuses the stored results of rows seen in a previous run
+
+    Also returns the row_state entry of every row; entries for new or changed
+    rows are created from freshly computed deadlines.
+    """
+    with stage_timer(stats, 'fingerprints', len(df)) as stage:
+        fingerprints = row_fingerprints(df)
+        entries = []
+        for fingerprint in fingerprints:
+            entry = row_state['rows'].get(fingerprint) or row_state['previous'].pop(fingerprint, None)
+            if entry is not None:
+                row_state['rows'][fingerprint] = entry
+            entries.append(entry)
+        new_positions = [position for position, entry in enumerate(entries) if entry is None]
+        stage['rows_out'] = len(new_positions)
+    row_state['reused'] += len(df) - len(new_positions)
+    row_state['computed'] += len(new_positions)
+
+    if new_positions:
+        stage_days, start_dates, positions, deadlines = coordination_deadlines(df.iloc[new_positions], stats)
+        new_deadlines = dict(zip(positions.tolist(), deadlines.astype(str)))
+        for i, (position, (days, stage_number, explanation), start_date) in enumerate(
+                zip(new_positions, stage_days, start_dates)):
+            entry = {'days': days, 'stage': stage_number, 'explanation': explanation,
+                     'start_date': None if pd.isna(start_date) else start_date.isoformat(),
+                     'deadline': new_deadlines.get(i)}
+            entries[position] = row_state['rows'][fingerprints[position]] = entry
+
+    stage_days = [(entry['days'], entry['stage'], entry['explanation']) for entry in entries]
+    start_dates = pd.to_datetime(pd.Series([entry['start_date'] for entry in entries], index=df.index,
+                                           dtype=object))
+    positions = np.array([position for position, entry in enumerate(entries) if entry['deadline'] is not None],
+                         dtype=np.intp)
+    deadlines = np.array([entries[position]['deadline'] for position in positions], dtype='datetime64[D]')
+    return stage_days, start_dates, positions, deadlines, entries
+
+
+def index_company_people(company_person_map, teams=None, previous_index=None):
+    """Flatten company_person_map into the match index used by process_coordinations
+
+    previous_index, the index of an earlier version of the database, lets
+    build_match_index reuse its fuzzy index entries.
+    """
+    all_people = []
+    for company, persons in company_person_map.items():
+        for person in persons:
+            person['company'] = company
+            all_people.append(person)
+
+    match_index = build_match_index(all_people, teams, previous_index)
+    match_index['db_hash'] = employee_db_hash(all_people)
+    return match_index
+
+
+def match_row_approvers(not_checked_approvers, checked_approvers, match_index, match_cache, team_match_cache,
+                        matching_log=None, stats=None):
+    """Resolve the approvers a coordination is waiting on
+
+    Returns (emails, companies, unmatched names); approvers whose team already
+    checked the coordination are skipped.
+    """
+    all_people = match_index['people']
+    coord_emails = []
+    coord_companies = set()
+    unmatched = []
+
+    for approver_name in not_checked_approvers:
+        if is_team_checked(approver_name, all_people, checked_approvers, matching_log, match_index,
+                           match_cache, team_match_cache, stats):
+            count_stat(stats, 'team_short_circuits')
+            continue
+
+        best_match = resolve_approver(approver_name, all_people, match_index, match_cache, matching_log, stats)
+        if best_match:
+            coord_emails.append(best_match['email'])
+            coord_companies.add(best_match['company'])
+        else:
+            count_stat(stats, 'unmatched_approvers')
+            unmatched.append(approver_name)
+
+    return coord_emails, list(coord_companies), unmatched
+
+
+def process_coordinations(df, company_person_map, selected_date, batch_matching=False, match_cache=None,
+                          match_index=None, stats=None, row_state=None, unmatched_names=None, teams=None,
+                          fuzzy_workers=None):
+    """Process coordinations with disambiguation
+
+    With batch_matching, approver names of all overdue rows are resolved up front
+    and their fuzzy fallbacks are scored against their shortlists on all cores,
+    or on fuzzy_workers threads if it is given.
+    Approver names are resolved through match_cache, which is reset if it was
+    built for another employee database. A match_index from index_company_people
+    can be passed in to reuse it across calls; otherwise one is built with teams
+    (the database's team lists) for team sizes. Stage timings and matching
+    counters are added to stats (from new_run_stats) if it is given.
+
+    With a row_state from load_row_state, rows seen unchanged in the previous
+    run reuse their stored deadline and, once overdue, their approver matches.
+    Only new or changed rows get deadlines computed, and only rows without
+    stored matches (new, changed, or newly overdue) are matched.
+
+    Approvers of overdue rows not found in the database are counted in
+    unmatched_names (from new_unmatched_names) if it is given.
+    """
+    overdue_counts = defaultdict(int)
+    overdue_emails = []
+    overdue_coordination_ids = []
+    coordination_details = []
+    today = selected_date
+    debug_info = []
+    matching_log = []
+
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
+        return overdue_counts, overdue_emails, overdue_coordination_ids, coordination_details
+
+    id_column = df.columns[0]
+    count_stat(stats, 'rows_in', len(df))
+    if row_state is None:
+        stage_days, start_dates, positions, deadlines = coordination_deadlines(df, stats)
+        row_entries = None
+    else:
+        stage_days, start_dates, positions, deadlines, row_entries = incremental_deadlines(df, row_state, stats)
+
+    # Only overdue rows go on to approver matching
+    with stage_timer(stats, 'overdue_filter', len(positions)) as stage:
+        is_overdue = deadlines < np.datetime64(today)
+        positions = positions[is_overdue]
+        deadlines = deadlines[is_overdue]
+        overdue_df = df.iloc[positions]
+
+        overdue_rows = []
+        for position, coord_id, start_date, deadline, not_checked_text, checked_text in zip(
+                positions, overdue_df[id_column], start_dates.iloc[positions], deadlines.astype(object),
+                overdue_df['Не проверили на текущем шаге'].astype(str),
+                overdue_df['Проверили на текущем шаге'].astype(str)):
+            days, _, days_explanation = stage_days[position]
+            not_checked_approvers = [name.strip() for name in not_checked_text.split(',') if name.strip()]
+            checked_approvers = [name.strip() for name in checked_text.split(',') if name.strip()]
+
+            overdue_rows.append((coord_id, start_date, deadline, days, days_explanation,
+                                 not_checked_approvers, checked_approvers))
+        if row_entries is not None:
+            overdue_entries = [row_entries[position] for position in positions]
+        else:
+            overdue_entries = [None] * len(overdue_rows)
+        stage['rows_out'] = len(overdue_rows)
+    count_stat(stats, 'overdue', len(overdue_rows))
+
+    if match_index is None:
+        with stage_timer(stats, 'match_index'):
+            match_index = index_company_people(company_person_map, teams)
+
+    db_hash = match_index['db_hash']
+    if match_cache is None:
+        match_cache = new_match_cache(db_hash)
+    elif match_cache['db_hash'] != db_hash:
+        match_cache['db_hash'] = db_hash
+        match_cache['matches'] = {}
+    if row_state is not None and row_state['db_hash'] != db_hash:
+        # Stored matches were made against another employee database, stored deadlines still hold
+        row_state['db_hash'] = db_hash
+        for entry in list(row_state['rows'].values()) + list(row_state['previous'].values()):
+            entry.pop('match', None)
+
+    if batch_matching:
+        with stage_timer(stats, 'batch_matching') as stage:
+            pending_names = {}
+            for row, row_entry in zip(overdue_rows, overdue_entries):
+                if row_entry is not None and 'match' in row_entry:
+                    continue
+                for approver_name in row[5]:
+                    key = normalize_text(approver_name)
+                    if key not in match_cache['matches']:
+                        pending_names.setdefault(key, approver_name)
+
+            batch_matches = find_best_matches_batch(list(pending_names.values()), match_index, stats,
+                                                    fuzzy_workers)
+            for key, approver_name in pending_names.items():
+                best_match = batch_matches[approver_name]
+                match_cache['matches'][key] = best_match['email'] if best_match else None
+            match_cache['misses'] += len(pending_names)
+            stage['rows_in'] = stage['rows_out'] = len(pending_names)
+
+    team_match_cache = {}
+    with stage_timer(stats, 'matching', len(overdue_rows)) as stage:
+        for row_entry, (coord_id, start_date, deadline, working_days, days_explanation,
+                        not_checked_approvers, checked_approvers) in zip(overdue_entries, overdue_rows):
+            if row_entry is not None and 'match' in row_entry:
+                coord_emails, coord_companies, unmatched = row_entry['match']
+                count_stat(stats, 'matches_reused')
+            else:
+                coord_emails, coord_companies, unmatched = match_row_approvers(
+                    not_checked_approvers, checked_approvers, match_index, match_cache, team_match_cache,
+                    matching_log, stats
+                )
+                if row_entry is not None:
+                    row_entry['match'] = [coord_emails, coord_companies, unmatched]
+            count_unmatched_names(unmatched_names, unmatched)
+
+            for company in coord_companies:
+                overdue_counts[company] += 1
+            overdue_emails.extend(coord_emails)
+            overdue_coordination_ids.append(coord_id)
+
+            coordination_details.append({
+                'id': coord_id, 'company': ', '.join(coord_companies),
+                'start_date': start_date.date(), 'deadline': deadline,
+                'working_days': working_days, 'not_checked_count': len(not_checked_approvers),
+                'explanation': days_explanation, 'emails': coord_emails
+            })
+        stage['rows_out'] = len(coordination_details)
+
+    return overdue_counts, overdue_emails, overdue_coordination_ids, coordination_details
+
+
+def file_size(file):
+    """Size in bytes of an open file object"""
+    position = file.tell()
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
+
+
+def iter_coordination_chunks(uploaded_file, chunk_size=COORDINATION_CHUNK_SIZE):
+    """Read a coordination export as DataFrames of at most chunk_size rows
+
+    Yields (chunk, fraction of the file read so far). CSV is read with pandas
+    chunksize and XLSX through a read-only openpyxl workbook, so only one chunk
+    is held in memory at a time.
+    """
+    if uploaded_file.name.endswith('.csv'):
+        total_size = file_size(uploaded_file) or 1
+        for chunk in pd.read_csv(uploaded_file, sep=';', encoding='utf-8', chunksize=chunk_size):
+            yield chunk, min(uploaded_file.tell() / total_size, 1.0)
+        return
+
+    workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        columns = [name if name is not None else f'Unnamed: {i}' for i, name in enumerate(header)]
+        total_rows = max((sheet.max_row or 0) - 1, 1)
+        rows_read = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunk_size:
+                rows_read += len(batch)
+                # Empty cells come back as None, pandas.read_excel gives NaN
+                yield pd.DataFrame(batch, columns=columns).fillna(np.nan), min(rows_read / total_rows, 1.0)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns).fillna(np.nan), 1.0
+    finally:
+        workbook.close()
+
+
+def process_coordinations_chunked(chunks, company_person_map, selected_date, batch_matching=False,
+                                  match_cache=None, progress_callback=None, match_index=None, stats=None,
+                                  row_state=None, pool=None, unmatched_names=None, teams=None,
+                                  fuzzy_workers=None):
+    """Process (chunk, fraction) pairs from iter_coordination_chunks and merge the results
+
+    progress_callback, if given, is called after each chunk with the rows
+    processed, overdue coordinations found and the fraction of the file read.
+    With stats, time spent reading chunks is recorded as the 'read' stage.
+    With a pool from make_process_pool, each chunk is processed by
+    process_coordinations_parallel, unless a row_state is given. Without a
+    match_index, one is built with teams as in process_coordinations.
+    fuzzy_workers is passed to process_coordinations for chunks processed
+    here.
+    """
+    overdue_counts = defaultdict(int)
+    overdue_emails = []
+    overdue_coordination_ids = []
+    coordination_details = []
+
+    if match_index is None:
+        match_index = index_company_people(company_person_map, teams)
+    if match_cache is None:
+        match_cache = new_match_cache(match_index['db_hash'])
+
+    rows_processed = 0
+    chunks = iter(chunks)
+    while True:
+        with stage_timer(stats, 'read') as stage:
+            chunk, fraction = next(chunks, (None, None))
+            stage['rows_out'] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+
+        if pool is not None and row_state is None:
+            counts, emails, coordination_ids, details = process_coordinations_parallel(
+                chunk, company_person_map, selected_date, batch_matching=batch_matching,
+                match_cache=match_cache, match_index=match_index, stats=stats, pool=pool,
+                unmatched_names=unmatched_names
+            )
+        else:
+            counts, emails, coordination_ids, details = process_coordinations(
+                chunk, company_person_map, selected_date, batch_matching=batch_matching,
+                match_cache=match_cache, match_index=match_index, stats=stats, row_state=row_state,
+                unmatched_names=unmatched_names, fuzzy_workers=fuzzy_workers
+            )
+        for company, count in counts.items():
+            overdue_counts[company] += count
+        overdue_emails.extend(emails)
+        overdue_coordination_ids.extend(coordination_ids)
+        coordination_details.extend(details)
+
+        rows_processed += len(chunk)
+        if progress_callback:
+            progress_callback(rows_processed, len(overdue_coordination_ids), fraction)
+
+    return overdue_counts, overdue_emails, overdue_coordination_ids, coordination_details
+
+
+def parquet_available():
+    """Whether pyarrow is installed for Parquet export"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_cell_value(value):
+    """Value of a details cell as written to XLSX and CSV, None for an empty cell"""
+    if isinstance(value, list):
+        # Same text as the DataFrame export gave for the emails lists
+        return str(value)
+    if value is None or value == '' or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value
+
+
+def write_coordination_details(coordination_details, output, file_format='xlsx'):
+    """Write coordination details to a path or binary buffer, row by row
+
+    XLSX is written by xlsxwriter in constant_memory mode, CSV by the csv
+    module and Parquet (needs pyarrow) in row groups of EXPORT_BATCH_SIZE, so
+    no DataFrame or second copy of the details is built.
+    """
+    columns = list(coordination_details[0]) if coordination_details else []
+    if file_format == 'csv':
+        write_details_csv(coordination_details, columns, output)
+    elif file_format == 'parquet':
+        write_details_parquet(coordination_details, columns, output)
+    else:
+        write_details_xlsx(coordination_details, columns, output)
+
+
+def write_details_xlsx(coordination_details, columns, output):
+    """Stream coordination details into an Excel sheet laid out like DataFrame.to_excel"""
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    try:
+        sheet = workbook.add_worksheet('Coordination Details')
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        date_format = workbook.add_format({'num_format': 'YYYY-MM-DD'})
+        for column_number, column in enumerate(columns):
+            sheet.write_string(0, column_number, column, header_format)
+
+        for row_number, details in enumerate(coordination_details, 1):
+            for column_number, column in enumerate(columns):
+                value = export_cell_value(details[column])
+                if value is None:
+                    continue
+                if isinstance(value, (datetime, date)):
+                    sheet.write_datetime(row_number, column_number, value, date_format)
+                else:
+                    sheet.write(row_number, column_number, value)
+    finally:
+        workbook.close()
+
+
+def write_details_csv(coordination_details, columns, output):
+    """Stream coordination details as ';'-separated CSV, with a BOM so Excel reads it as UTF-8"""
+    if isinstance(output, (str, Path)):
+        text_output = open(output, 'w', encoding='utf-8-sig', newline='')
+    else:
+        text_output = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    try:
+        writer = csv.writer(text_output, delimiter=';')
+        writer.writerow(columns)
+        for details in coordination_details:
+            writer.writerow(['' if value is None else value
+                             for value in (export_cell_value(details[column]) for column in columns)])
+    finally:
+        if isinstance(output, (str, Path)):
+            text_output.close()
+        else:
+            # Leave the caller's buffer open
+            text_output.flush()
+            text_output.detach()
+
+
+def write_details_parquet(coordination_details, columns, output):
+    """Write coordination details to Parquet one row group of EXPORT_BATCH_SIZE rows at a time"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    column_types = {
+        'company': pa.string(), 'start_date': pa.date32(), 'deadline': pa.date32(),
+        'working_days': pa.int64(), 'not_checked_count': pa.int64(), 'explanation': pa.string(),
+        'emails': pa.list_(pa.string())
+    }
+    # Other columns, i.e. the coordination id, keep the export's type, or become text if it is mixed
+    text_columns = []
+    for column in columns:
+        if column not in column_types:
+            try:
+                column_types[column] = pa.array([details[column] for details in coordination_details]).type
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                column_types[column] = pa.string()
+                text_columns.append(column)
+    schema = pa.schema([(column, column_types[column]) for column in columns])
+
+    writer = None
+    try:
+        for start in range(0, len(coordination_details), EXPORT_BATCH_SIZE):
+            batch = coordination_details[start:start + EXPORT_BATCH_SIZE]
+            if text_columns:
+                batch = [{**details, **{column: str(details[column]) for column in text_columns}}
+                         for details in batch]
+            if writer is None:
+                writer = pq.ParquetWriter(output, schema)
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        if writer is None:
+            pq.write_table(pa.table({}), output)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def overdue_emails_text(overdue_emails):
+    """Distinct overdue emails, one per line"""
+    return "\n".join(sorted(set(overdue_emails)))
+
+
+def connect_history_db(path=HISTORY_DB_FILE):
+    """Open the SQLite store of past run results, creating the schema if needed
+
+    Every run adds a runs row and its per-company counts and overdue
+    coordinations, indexed by reference date, company and coordination id
+    so history queries read only the rows they select.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reference_date TEXT NOT NULL,
+            source TEXT NOT NULL,
+            recorded_at TEXT NOT NULL,
+            total_overdue INTEGER NOT NULL,
+            unique_emails INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_runs_date ON runs (reference_date, source);
+        CREATE TABLE IF NOT EXISTS company_overdue (
+            run_id INTEGER NOT NULL REFERENCES runs (run_id),
+            reference_date TEXT NOT NULL,
+            company TEXT NOT NULL,
+            overdue INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_company_overdue ON company_overdue (company, reference_date);
+        CREATE INDEX IF NOT EXISTS idx_company_overdue_date ON company_overdue (reference_date);
+        CREATE TABLE IF NOT EXISTS coordination_overdue (
+            run_id INTEGER NOT NULL REFERENCES runs (run_id),
+            reference_date TEXT NOT NULL,
+            coordination_id TEXT NOT NULL,
+            company TEXT NOT NULL,
+            start_date TEXT,
+            deadline TEXT,
+            working_days INTEGER,
+            not_checked_count INTEGER,
+            explanation TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_coordination_overdue ON coordination_overdue (coordination_id, reference_date);
+        CREATE INDEX IF NOT EXISTS idx_coordination_overdue_date ON coordination_overdue (reference_date);
+    """)
+    return conn
+
+
+def history_date_text(value):
+    """ISO text of a details date, None if it is missing"""
+    return None if value is None or pd.isna(value) else value.isoformat()
+
+
+def record_run_history(overdue_counts, overdue_emails, coordination_details, reference_date, source,
+                       path=HISTORY_DB_FILE):
+    """Append one run's results to the history store in one transaction, returning its run_id"""
+    reference_date = reference_date.isoformat()
+    conn = connect_history_db(path)
+    try:
+        with conn:
+            run_id = conn.execute(
+                """INSERT INTO runs (reference_date, source, recorded_at, total_overdue, unique_emails)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (reference_date, source, datetime.now().isoformat(timespec='seconds'),
+                 len(coordination_details), len(set(overdue_emails)))
+            ).lastrowid
+            conn.executemany('INSERT INTO company_overdue VALUES (?, ?, ?, ?)',
+                             [(run_id, reference_date, company, int(count)) for company, count in overdue_counts.items()])
+            conn.executemany(
+                'INSERT INTO coordination_overdue VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, reference_date, str(details['id']), details['company'],
+                  history_date_text(details['start_date']), history_date_text(details['deadline']),
+                  int(details['working_days']), int(details['not_checked_count']), details['explanation'])
+                 for details in coordination_details]
+            )
+    finally:
+        conn.close()
+    return run_id
+
+
+def latest_runs_filter(date_from=None, date_to=None, sum_sources=True):
+    """SQL condition and parameters selecting the latest run per reference date and source in a date range
+
+    Re-running an export for the same date replaces its earlier results in
+    history queries instead of counting them twice. Without sum_sources only
+    the latest run per reference date is selected, whatever its source, for
+    exports whose file name changes between uploads of the same data.
+    """
+    conditions, params = history_date_conditions('reference_date', date_from, date_to)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    group_by = 'reference_date, source' if sum_sources else 'reference_date'
+    return (f"run_id IN (SELECT MAX(run_id) FROM runs {where} GROUP BY {group_by})", params)
+
+
+def history_date_conditions(column, date_from=None, date_to=None):
+    """SQL conditions and parameters restricting column to the given reference dates"""
+    conditions, params = [], []
+    if date_from is not None:
+        conditions.append(f'{column} >= ?')
+        params.append(date_from.isoformat())
+    if date_to is not None:
+        conditions.append(f'{column} <= ?')
+        params.append(date_to.isoformat())
+    return conditions, params
+
+
+def company_overdue_trend(companies=None, date_from=None, date_to=None, sum_sources=True, path=HISTORY_DB_FILE):
+    """Overdue count per reference date and company
+
+    With sum_sources the counts of every source recorded that date are
+    summed, otherwise only the latest run of the date is counted.
+    """
+    runs_condition, runs_params = latest_runs_filter(date_from, date_to, sum_sources)
+    conditions, params = history_date_conditions('reference_date', date_from, date_to)
+    conditions.append(runs_condition)
+    params.extend(runs_params)
+    if companies:
+        conditions.append(f"company IN ({', '.join('?' * len(companies))})")
+        params.extend(companies)
+
+    conn = connect_history_db(path)
+    try:
+        trend = pd.read_sql_query(
+            f"""SELECT reference_date, company, SUM(overdue) AS overdue FROM company_overdue
+                WHERE {' AND '.join(conditions)} GROUP BY reference_date, company
+                ORDER BY reference_date, company""",
+            conn, params=params
+        )
+    finally:
+        conn.close()
+    trend['reference_date'] = pd.to_datetime(trend['reference_date']).dt.date
+    return trend
+
+
+def coordination_aging(coordination_ids=None, company=None, date_from=None, date_to=None, sum_sources=True,
+                       path=HISTORY_DB_FILE):
+    """How long each coordination has been overdue across the recorded runs
+
+    One row per coordination: when it was first and last recorded overdue,
+    on how many reference dates, and its company, deadline and days past the
+    deadline as of the last of them. company matches one of the
+    coordination's comma-separated companies. Runs are selected as in
+    company_overdue_trend.
+    """
+    runs_condition, runs_params = latest_runs_filter(date_from, date_to, sum_sources)
+    conditions, params = history_date_conditions('reference_date', date_from, date_to)
+    conditions.append(runs_condition)
+    params.extend(runs_params)
+    if coordination_ids:
+        conditions.append(f"coordination_id IN ({', '.join('?' * len(coordination_ids))})")
+        params.extend(str(coordination_id) for coordination_id in coordination_ids)
+    if company:
+        conditions.append("(', ' || company || ', ') LIKE ?")
+        params.append(f'%, {company}, %')
+
+    conn = connect_history_db(path)
+    try:
+        rows = pd.read_sql_query(
+            f"""SELECT coordination_id, reference_date, company, deadline FROM coordination_overdue
+                WHERE {' AND '.join(conditions)} ORDER BY reference_date""",
+            conn, params=params
+        )
+    finally:
+        conn.close()
+
+    aging = rows.groupby('coordination_id', sort=False).agg(
+        first_overdue=('reference_date', 'first'), last_overdue=('reference_date', 'last'),
+        dates_overdue=('reference_date', 'nunique'), company=('company', 'last'), deadline=('deadline', 'last')
+    ).reset_index()
+    for column in ['first_overdue', 'last_overdue', 'deadline']:
+        aging[column] = pd.to_datetime(aging[column]).dt.date
+    aging['days_overdue'] = (pd.to_datetime(aging['last_overdue']) - pd.to_datetime(aging['deadline'])).dt.days
+    return aging.sort_values('days_overdue', ascending=False, ignore_index=True)
+
+
+def history_companies(path=HISTORY_DB_FILE):
+    """Companies with recorded overdue counts"""
+    conn = connect_history_db(path)
+    try:
+        return [company for company, in conn.execute('SELECT DISTINCT company FROM company_overdue ORDER BY company')]
+    finally:
+        conn.close()
+
+
+_shared_match_state = None
+_process_pool_lock = threading.Lock()
+
+
+def _init_shared_match_state(company_person_map, teams=None, match_index=None):
+    """Pool initializer setting the match index once per worker, building it if not given"""
+    global _shared_match_state
+    if match_index is None:
+        match_index = index_company_people(company_person_map, teams)
+    _shared_match_state = (company_person_map, match_index)
+
+
+def shared_match_state():
+    """(company_person_map, match_index) shared with this process by make_process_pool"""
+    return _shared_match_state
+
+
+def make_process_pool(company_person_map, workers=None, match_index=None, teams=None):
+    """Process pool whose workers share one read-only employee match index
+
+    With fork the workers inherit the index built here, or match_index if it
+    is given; elsewhere it is sent once per worker through the pool
+    initializer, never per task. Fork workers are started before returning,
+    so pools made by concurrent jobs each inherit their own index.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        with _process_pool_lock:
+            _init_shared_match_state(company_person_map, teams, match_index)
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+            # With fork the first task starts every worker
+            pool.submit(int).result()
+        return pool
+    return ProcessPoolExecutor(workers, initializer=_init_shared_match_state,
+                               initargs=(company_person_map, teams, match_index))
+
+
+def _process_coordination_shard(shard, selected_date, batch_matching, known_matches, collect_stats,
+                                unmatched_limit=None):
+    """Pool task: process one row shard against the shared match index
+
+    Returns the process_coordinations results with the names resolved, the
+    unmatched approvers (if unmatched_limit is given) and the statistics of
+    this shard.
+    """
+    company_person_map, match_index = shared_match_state()
+    match_cache = new_match_cache(match_index['db_hash'])
+    match_cache['matches'] = known_matches
+    known_count = len(known_matches)
+    stats = new_run_stats() if collect_stats else None
+    unmatched_names = new_unmatched_names(unmatched_limit) if unmatched_limit is not None else None
+
+    # Sibling workers use the other cores, so fuzzy fallbacks are scored on this one
+    results = process_coordinations(shard, company_person_map, selected_date, batch_matching=batch_matching,
+                                     match_cache=match_cache, match_index=match_index, stats=stats,
+                                     unmatched_names=unmatched_names, fuzzy_workers=1)
+    # Matches keep insertion order, so names resolved here follow the known ones
+    new_matches = dict(list(match_cache['matches'].items())[known_count:])
+    return results, new_matches, match_cache['lookups'], match_cache['misses'], unmatched_names, stats
+
+
+def shard_known_matches(shard, matches):
+    """Resolved names from matches for the approvers listed in shard, the only ones its task can look up"""
+    keys = set()
+    for column in ('Не проверили на текущем шаге', 'Проверили на текущем шаге'):
+        if column in shard.columns:
+            for text in shard[column].astype(str).unique():
+                keys.update(normalize_text(name.strip()) for name in text.split(',') if name.strip())
+    return {key: matches[key] for key in keys if key in matches}
+
+
+def process_coordinations_parallel(df, company_person_map, selected_date, batch_matching=False, match_cache=None,
+                                   match_index=None, stats=None, pool=None, workers=None,
+                                   shard_size=PARALLEL_SHARD_SIZE, unmatched_names=None, teams=None):
+    """process_coordinations over row shards of df in a process pool
+
+    Shards of shard_size rows run in pool (from make_process_pool with the same
+    company_person_map), or in a pool of workers processes made for this call.
+    Results are merged in shard order, so they match the serial path, and the
+    names resolved by the workers are added to match_cache. Without a
+    match_index, one is built with teams as in process_coordinations.
+    """
+    overdue_counts = defaultdict(int)
+    overdue_emails = []
+    overdue_coordination_ids = []
+    coordination_details = []
+
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
+        return overdue_counts, overdue_emails, overdue_coordination_ids, coordination_details
+
+    if match_index is None:
+        match_index = index_company_people(company_person_map, teams)
+    if match_cache is None:
+        match_cache = new_match_cache(match_index['db_hash'])
+    elif match_cache['db_hash'] != match_index['db_hash']:
+        match_cache['db_hash'] = match_index['db_hash']
+        match_cache['matches'] = {}
+
+    shards = [df.iloc[start:start + shard_size] for start in range(0, len(df), shard_size)]
+    own_pool = pool is None
+    if own_pool:
+        pool = make_process_pool(company_person_map, workers, match_index)
+    unmatched_limit = unmatched_names['limit'] if unmatched_names is not None else None
+    try:
+        with stage_timer(stats, 'parallel', len(df)) as stage:
+            # Each task gets its own names, taken before the merge below adds to the cache
+            futures = [pool.submit(_process_coordination_shard, shard, selected_date, batch_matching,
+                                   shard_known_matches(shard, match_cache['matches']), stats is not None,
+                                   unmatched_limit)
+                       for shard in shards]
+            for future in futures:
+                (counts, emails, coordination_ids, details), new_matches, lookups, misses, shard_unmatched, \
+                    shard_stats = future.result()
+                for company, count in counts.items():
+                    overdue_counts[company] += count
+                overdue_emails.extend(emails)
+                overdue_coordination_ids.extend(coordination_ids)
+                coordination_details.extend(details)
+
+                match_cache['matches'].update(new_matches)
+                match_cache['lookups'] += lookups
+                match_cache['misses'] += misses
+                if unmatched_names is not None:
+                    merge_unmatched_names(unmatched_names, shard_unmatched)
+                if stats is not None:
+                    merge_run_stats(stats, shard_stats)
+            stage['rows_out'] = len(coordination_details)
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+    return overdue_counts, overdue_emails, overdue_coordination_ids, coordination_details
+
+
+_state_files_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Raised in a background job when it was cancelled"""
+
+
+def new_job_registry(workers=JOB_WORKERS):
+    """Background jobs by id, with the thread pool that runs them"""
+    return {'executor': ThreadPoolExecutor(workers, thread_name_prefix='coordination-job'),
+            'jobs': {}, 'lock': threading.Lock()}
+
+
+def submit_job(registry, run, description=''):
+    """Queue run(job) in the registry's pool and return the new job's id
+
+    run reports progress by setting job['progress'] and should call
+    check_job_cancelled(job) regularly; its return value becomes
+    job['result']. Only the last JOB_HISTORY_SIZE finished jobs are kept.
+    """
+    job = {'id': uuid.uuid4().hex[:12], 'description': description, 'status': 'queued', 'progress': {},
+           'result': None, 'error': None, 'submitted': datetime.now(), 'finished': None,
+           'cancel_event': threading.Event()}
+    with registry['lock']:
+        registry['jobs'][job['id']] = job
+        finished = [job_id for job_id, other in registry['jobs'].items() if other['finished'] is not None]
+        for job_id in finished[:max(len(finished) - JOB_HISTORY_SIZE, 0)]:
+            del registry['jobs'][job_id]
+    registry['executor'].submit(_run_job, job, run)
+    return job['id']
+
+
+def _run_job(job, run):
+    """Run a job from submit_job and record its outcome"""
+    try:
+        check_job_cancelled(job)
+        job['status'] = 'running'
+        job['result'] = run(job)
+        job['status'] = 'done'
+    except JobCancelled:
+        job['status'] = 'cancelled'
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = f"{e}\n{traceback.format_exc()}"
+    finally:
+        job['finished'] = datetime.now()
+
+
+def get_job(registry, job_id):
+    """Job by id, or None if it is unknown or was dropped from the history"""
+    with registry['lock']:
+        return registry['jobs'].get(job_id)
+
+
+def cancel_job(registry, job_id):
+    """Ask a queued or running job to stop"""
+    job = get_job(registry, job_id)
+    if job is not None:
+        job['cancel_event'].set()
+
+
+def check_job_cancelled(job):
+    """Raise JobCancelled if the job was asked to stop"""
+    if job['cancel_event'].is_set():
+        raise JobCancelled()
+
+
+def run_coordination_matching(job, coordination_file, company_person_map, match_index, selected_date,
+                              batch_matching=True, persist_match_cache=True, incremental=True, parallel=False,
+                              collect_stats=False, record_history=False):
+    """Data Matching run for submit_job: process the export and save the caches
+
+    Progress (rows processed, overdue found, fraction read) is set in
+    job['progress'] after each chunk, which is also where a cancelled run
+    stops, before any cache is saved. Jobs save the caches one at a time, and
+    names another job saved meanwhile are kept in the match cache. With
+    record_history the results are appended to the history store. Returns
+    the results and run summary the Data Matching page shows.
+    """
+    unmatched_names = new_unmatched_names()
+    match_cache = load_match_cache() if persist_match_cache else new_match_cache()
+    row_state = load_row_state() if incremental else None
+    stats = new_run_stats() if collect_stats else None
+
+    def report_progress(rows_processed, overdue_found, fraction):
+        job['progress'] = {'rows_processed': rows_processed, 'overdue_found': overdue_found, 'fraction': fraction}
+        check_job_cancelled(job)
+
+    use_pool = parallel and not incremental
+    with make_process_pool(company_person_map, match_index=match_index) if use_pool else nullcontext() as pool:
+        overdue_counts, overdue_emails, overdue_coordination_ids, coordination_details = \
+            process_coordinations_chunked(
+                iter_coordination_chunks(coordination_file), company_person_map, selected_date,
+                batch_matching=batch_matching, match_cache=match_cache, progress_callback=report_progress,
+                match_index=match_index, stats=stats, row_state=row_state, pool=pool,
+                unmatched_names=unmatched_names
+            )
+    with _state_files_lock:
+        if persist_match_cache:
+            saved_cache = load_match_cache()
+            if saved_cache['db_hash'] == match_cache['db_hash']:
+                saved_cache['matches'].update(match_cache['matches'])
+                match_cache['matches'] = saved_cache['matches']
+            save_match_cache(match_cache)
+        if incremental:
+            save_row_state(row_state)
+    if record_history:
+        record_run_history(overdue_counts, overdue_emails, coordination_details, selected_date,
+                           coordination_file.name)
+
+    return {
+        'overdue_counts': overdue_counts,
+        'overdue_emails': overdue_emails,
+        'overdue_coordination_ids': overdue_coordination_ids,
+        'coordination_details': coordination_details,
+        'unmatched_names': unmatched_names,
+        'match_cache': {'hits': match_cache['lookups'] - match_cache['misses'], 'misses': match_cache['misses'],
+                        'cached': len(match_cache['matches'])},
+        'row_state': {'reused': row_state['reused'], 'computed': row_state['computed']} if incremental else None,
+        'stats': stats
+    }
@@ -1,55 +1,86 @@
 import streamlit as st
-import re
-import json
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 from collections import defaultdict
-from pathlib import Path
-import os
 import traceback
-import unicodedata
-from rapidfuzz import fuzz, process
-import xlsxwriter
 import io
-
-# Configuration
-EMPLOYEE_DB_FILE = 'employee_database.json'
-public_domains = {'mail', 'yandex', 'gmail', 'yahoo', 'hotmail', 'outlook'}
-no_match_array = []
-holidays = ['01-01', '02-01', '03-01', '04-01', '05-01', '06-01', '07-01', '23-02', '08-03', '01-05', '09-05', '12-06',
-            '03-11', '04-11']
-working_holidays = ['01-11']
+import json
+import time
+import tempfile
+from functools import partial
+from pathlib import Path
+from coordinations_core import (
+    read_employee_db, write_employee_db, employee_db_signature,
+    extract_employees_bulk, build_company_person_map, index_company_people,
+    new_employee_db, write_coordination_details, overdue_emails_text, new_run_stats, stage_timer,
+    EXPORT_FORMATS, parquet_available, new_job_registry, submit_job, get_job, cancel_job,
+    run_coordination_matching, company_overdue_trend, coordination_aging, history_companies, unmatched_names_csv
+)
+
+DETAILS_PREVIEW_ROWS = 1000
+JOB_POLL_SECONDS = 1.0
+EXPORT_CACHE_SIZE = 4
 
 # Initialize session state
 if 'employee_db' not in st.session_state:
-    st.session_state.employee_db = {'employees': [], 'companies': set()}
+    st.session_state.employee_db = new_employee_db()
 if 'processing_results' not in st.session_state:
     st.session_state.processing_results = None
 
 
+@st.cache_resource(max_entries=1, show_spinner=False)
+def cached_employee_db(signature):
+    """Employee database as read for a given file signature, shared across reruns"""
+    return read_employee_db()
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def cached_match_structures(signature):
+    """company_person_map and match index for the employee database, shared across reruns
+
+    The index of the previous database version is reused, so only employees
+    added since are added to its fuzzy index.
+    """
+    db = cached_employee_db(signature)
+    company_person_map = build_company_person_map(db['employees'])
+    last_index = last_match_index()
+    match_index = index_company_people(company_person_map, db['teams'], last_index.get('match_index'))
+    last_index['match_index'] = match_index
+    return company_person_map, match_index
+
+
+@st.cache_resource(show_spinner=False)
+def last_match_index():
+    """The most recently built match index, kept when cached_match_structures is cleared"""
+    return {}
+
+
+@st.cache_resource(show_spinner=False)
+def job_registry():
+    """Background matching jobs, shared by all sessions and kept across reruns"""
+    return new_job_registry()
+
+
 def load_employee_db():
     """Load employee database from file"""
     try:
-        if Path(EMPLOYEE_DB_FILE).exists():
-            with open(EMPLOYEE_DB_FILE, 'r', encoding='utf-8') as f:
-                db = json.load(f)
-                db['companies'] = set(db['companies'])
-                st.session_state.employee_db = db
-                return db
+        cached_db = cached_employee_db(employee_db_signature())
+        # Callers add to the lists, so keep the cached copy untouched
+        db = {'schema_version': cached_db['schema_version'], 'employees': list(cached_db['employees']),
+              'companies': set(cached_db['companies']), 'teams': dict(cached_db['teams'])}
+        st.session_state.employee_db = db
+        return db
     except Exception as e:
         st.error(f"⚠️ Error loading employee database: {e}")
-    return {'employees': [], 'companies': set()}
+    return new_employee_db()
 
 
-def save_employee_db(db):
-    """Save employee database to file"""
+def save_employee_db(db, changed_employees=None):
+    """Save the employee database through write_employee_db and drop the cached copies"""
     try:
-        db_to_save = {
-            'employees': db['employees'],
-            'companies': list(db['companies'])
-        }
-        with open(EMPLOYEE_DB_FILE, 'w', encoding='utf-8') as f:
-            json.dump(db_to_save, f, ensure_ascii=False, indent=2)
+        write_employee_db(db, changed_employees)
+        cached_employee_db.clear()
+        cached_match_structures.clear()
         st.session_state.employee_db = db
         return True
     except Exception as e:
@@ -57,56 +88,213 @@ def save_employee_db(db):
         return False
 
 
-def normalize_text(text):
-    """Normalize text by removing accents, special characters, and converting to lowercase"""
-    if not isinstance(text, str):
-        return ""
-
-    text = unicodedata.normalize('NFKD', text)
-    text = ''.join([c for c in text if not unicodedata.combining(c)])
-    text = re.sub(r'[^\w\s.]', '', text)
-    return text.lower().strip()
-
-
-def is_initial(part):
-    """Check if a name part is an initial"""
-    return len(part) <= 2 or (len(part) == 2 and part.endswith('.'))
-
-
-def extract_name_components(name):
-    """Extract surname and given names from a full name with proper handling of initials"""
-    if not isinstance(name, str):
-        return "", ""
-
-    clean_name = re.sub(r'[^а-яА-ЯёЁa-zA-Z\s.]', '', name).strip()
-
-    if ',' in clean_name:
-        parts = [p.strip() for p in clean_name.split(',')]
-        if len(parts) >= 2:
-            return parts[0], parts[1]
-
-    parts = [p for p in re.split(r'\s+', clean_name) if p]
-
-    if not parts:
-        return "", ""
-    if len(parts) == 1:
-        return parts[0], ""
-
-    if is_initial(parts[-1]):
-        return parts[0], parts[-1]
-
-    if is_initial(parts[0]):
-        return parts[-1], parts[0]
+def show_run_stats(stats, file_name):
+    """Show stage timings and counters of a run in an expander, with a JSON download"""
+    with st.expander("⏱️ Run Statistics"):
+        stages_df = pd.DataFrame([{'stage': name, **totals} for name, totals in stats['stages'].items()])
+        st.dataframe(stages_df)
+        st.json(dict(stats['counters']))
+        st.download_button(
+            label="📥 Download Run Statistics (JSON)",
+            data=json.dumps(stats, ensure_ascii=False, indent=2),
+            file_name=file_name,
+            mime="application/json"
+        )
+
+
+@st.cache_data(max_entries=EXPORT_CACHE_SIZE, show_spinner=False)
+def job_details_export(job_id, file_format, _coordination_details):
+    """Coordination details of a finished job written in file_format, once per job and format"""
+    file_name, _ = EXPORT_FORMATS[file_format]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / file_name
+        write_coordination_details(_coordination_details, path, file_format)
+        return path.read_bytes()
+
+
+def details_download_button(job_id, coordination_details, file_format):
+    """Download button for the coordination details of a job, written in file_format"""
+    file_name, mime = EXPORT_FORMATS[file_format]
+    st.download_button(
+        label=f"📥 Download Coordination Details ({file_format.upper()})",
+        data=job_details_export(job_id, file_format, coordination_details),
+        file_name=file_name,
+        mime=mime
+    )
+
+
+def attached_matching_job_id():
+    """Id of the matching job this page follows, from session state or the page URL after a reconnect"""
+    job_id = st.session_state.get('matching_job_id')
+    if job_id is None:
+        job_id = st.experimental_get_query_params().get('job', [None])[0]
+    return job_id
+
+
+def attach_matching_job(job_id):
+    """Follow a matching job, keeping its id in the page URL, or stop following with None"""
+    st.session_state.matching_job_id = job_id
+    if job_id:
+        st.experimental_set_query_params(job=job_id)
+    else:
+        st.experimental_set_query_params()
+
+
+def show_matching_job(job, registry, export_format):
+    """Progress of a queued or running matching job, polled until it ends, or its outcome"""
+    if job['status'] in ('queued', 'running'):
+        progress = job['progress']
+        if job['status'] == 'queued':
+            text = f"{job['description']}: waiting for another job to finish..."
+        elif progress:
+            text = (f"{job['description']}: processed {progress['rows_processed']} rows, "
+                    f"{progress['overdue_found']} overdue found")
+        else:
+            text = f"{job['description']}: reading coordination file..."
+        st.progress(progress.get('fraction', 0.0), text=text)
+        if st.button("Cancel"):
+            cancel_job(registry, job['id'])
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+    elif job['status'] == 'done':
+        st.session_state.processing_results = job['result']
+        show_matching_results(job['result'], export_format, job['id'])
+    elif job['status'] == 'cancelled':
+        st.warning(f"⚠️ Matching of {job['description']} was cancelled")
+    else:
+        st.error(f"⚠️ Matching of {job['description']} failed: {job['error']}")
+
+
+def show_matching_results(results, export_format, job_id):
+    """Summary, details preview and downloads of a finished matching run"""
+    overdue_counts = results['overdue_counts']
+    overdue_emails = results['overdue_emails']
+    coordination_details = results['coordination_details']
+
+    st.success("✅ Data matching completed!")
+
+    # Summary statistics
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total Overdue", len(results['overdue_coordination_ids']))
+    with col2:
+        st.metric("Unique Emails", len(set(overdue_emails)))
+    with col3:
+        st.metric("Companies Involved", len(overdue_counts))
+    match_cache = results['match_cache']
+    st.caption(f"Name resolution cache: {match_cache['hits']} hits, "
+               f"{match_cache['misses']} misses, {match_cache['cached']} names cached")
+    if results['row_state'] is not None:
+        st.caption(f"Rows reused from the last run: {results['row_state']['reused']}, "
+                   f"recomputed: {results['row_state']['computed']}")
+
+    # Overdue counts by company
+    st.subheader("Overdue Coordination Count by Company:")
+    for company, count in sorted(overdue_counts.items(), key=lambda x: x[1], reverse=True):
+        st.write(f"- **{company}**: {count}")
+
+    # Coordination details
+    st.subheader("Coordination Details:")
+    if coordination_details:
+        # Only a preview page is rendered, the download has every row
+        st.dataframe(pd.DataFrame(coordination_details[:DETAILS_PREVIEW_ROWS]))
+        if len(coordination_details) > DETAILS_PREVIEW_ROWS:
+            st.caption(f"Showing the first {DETAILS_PREVIEW_ROWS} of {len(coordination_details)} "
+                       f"coordinations, download the file for all of them")
+
+        # Download buttons
+        col1, col2 = st.columns(2)
+
+        with col1:
+            details_download_button(job_id, coordination_details, export_format)
+
+        with col2:
+            # Download overdue emails
+            emails_text = overdue_emails_text(overdue_emails)
+            st.download_button(
+                label="📧 Download Overdue Emails",
+                data=emails_text,
+                file_name="overdue_emails.txt",
+                mime="text/plain"
+            )
+
+    unmatched_names = results['unmatched_names']
+    if unmatched_names['counts']:
+        st.warning(f"⚠️ {len(unmatched_names['counts'])} people were not found in data")
+        st.dataframe(pd.DataFrame(unmatched_names['counts'].most_common(DETAILS_PREVIEW_ROWS),
+                                  columns=['name', 'occurrences']))
+        if unmatched_names['other']:
+            st.caption(f"Only the first {unmatched_names['limit']} names are listed, "
+                       f"{unmatched_names['other']} more occurrences of other names were not tracked")
+        st.download_button(
+            label="📥 Download Unmatched Names",
+            data=unmatched_names_csv(unmatched_names),
+            file_name="unmatched_names.csv",
+            mime="text/csv"
+        )
+
+    if results['stats'] is not None:
+        show_run_stats(results['stats'], "matching_stats.json")
+
+
+def show_history():
+    """Per-company overdue trends and coordination aging from the recorded runs"""
+    companies = history_companies()
+    if not companies:
+        st.info("No runs recorded yet. Process coordinations with \"Save results to history\" enabled first.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        date_from = st.date_input("From reference date", value=None)
+    with col2:
+        date_to = st.date_input("To reference date", value=None)
+    sum_sources = st.checkbox("Sum counts across export files recorded for the same date", value=True,
+                              help="Turn off if the same export was uploaded under different file names, "
+                                   "to count only the latest run of each date")
+
+    st.subheader("Overdue Coordinations by Company:")
+    selected_companies = st.multiselect("Companies (all if none selected)", companies)
+    trend = company_overdue_trend(selected_companies, date_from, date_to, sum_sources)
+    if trend.empty:
+        st.info("No recorded runs in this date range.")
+    else:
+        if sum_sources:
+            st.caption("Counts are summed across the export files recorded for each date, "
+                       "using the latest run of each file")
+        else:
+            st.caption("Counts are from the latest run of each date only")
+        trend_table = trend.pivot(index='reference_date', columns='company', values='overdue').fillna(0)
+        st.line_chart(trend_table)
+        st.dataframe(trend_table)
+
+    st.subheader("Coordination Aging:")
+    col1, col2 = st.columns(2)
+    with col1:
+        coordination_ids = st.text_input("Coordination IDs (comma-separated, all if empty)")
+    with col2:
+        aging_company = st.selectbox("Company", [None] + companies,
+                                     format_func=lambda company: "All companies" if company is None else company)
+    coordination_ids = [value.strip() for value in coordination_ids.split(',') if value.strip()]
+    aging = coordination_aging(coordination_ids, aging_company, date_from, date_to, sum_sources)
+    if aging.empty:
+        st.info("No overdue coordinations recorded for this selection.")
+    else:
+        st.dataframe(aging.head(DETAILS_PREVIEW_ROWS))
+        if len(aging) > DETAILS_PREVIEW_ROWS:
+            st.caption(f"Showing the {DETAILS_PREVIEW_ROWS} longest overdue of {len(aging)} coordinations")
 
-    return parts[-1], " ".join(parts[:-1])
 
+def parse_company_person_data(uploaded_files, db, stats=None):
+    """Process company and employee data files as one import, with name handling and team support
 
-def parse_company_person_data(uploaded_file, db):
-    """Process company and employee data with enhanced name handling and team support"""
+    Employees are deduplicated by email across all the files, manual
+    assignments from every file are queued together and the database is
+    saved once.
+    """
     company_person_map = defaultdict(list)
     new_employees = []
     seen_emails = {e['email'] for e in db['employees']}
-    team_id_counter = 1
 
     # Initialize session state for manual assignments
     if 'manual_assignments' not in st.session_state:
@@ -114,102 +302,20 @@ def parse_company_person_data(uploaded_file, db):
     if 'processed_emails' not in st.session_state:
         st.session_state.processed_emails = set()
 
-    # Read uploaded file
-    if uploaded_file.name.endswith('.csv'):
-        df = pd.read_csv(uploaded_file, sep=';', encoding='utf-8')
-    else:
-        df = pd.read_excel(uploaded_file, engine='openpyxl')
-
-    file_content = '\n'.join(df.astype(str).values.flatten().tolist())
-
-    lines = file_content.split('\n')
-    combined_lines = []
-    current_combined_line = ""
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            if current_combined_line:
-                combined_lines.append(current_combined_line)
-                current_combined_line = ""
-            continue
-
-        if current_combined_line:
-            if current_combined_line.endswith('/'):
-                current_combined_line = current_combined_line.rstrip('/') + ' ' + line
-            else:
-                combined_lines.append(current_combined_line)
-                current_combined_line = line
-        else:
-            current_combined_line = line
-
-    if current_combined_line:
-        combined_lines.append(current_combined_line)
-
-    # Store found manual assignments in session state
-    temp_manual_assignments = {}
-
-    for line_num, line in enumerate(combined_lines, 1):
-        if not line.strip():
-            continue
-
-        for block in re.findall(r'(?:\(| - )([^()]+?\s+[^\s@]+@[^\s/@]+(?:\s*/\s*[^()]+?\s+[^\s@]+@[^\s/@]+)*)', line):
-            if '@' not in block:
-                continue
-
-            team_members = [p.strip() for p in block.split('/')]
-            team_id = f"team_{team_id_counter}"
-            team_id_counter += 1
-
-            team_company = None
-            team_emails = []
-
-            for person in team_members:
-                match = re.search(r'([^@]+)\s+([^\s@]+@[^\s@]+)', person)
-                if not match:
-                    continue
-
-                name, email = match.group(1).strip(), match.group(2).strip()
-                email = re.sub(r'[),.;]+$', '', email).strip()
-
-                # Skip if already processed in this session
-                if email in st.session_state.processed_emails:
-                    continue
-
-                if email in seen_emails:
-                    continue
-                seen_emails.add(email)
-                team_emails.append(email)
-
-                domain = email.split('@')[-1].split('.')[0]
-                surname, given_names = extract_name_components(name)
-                normalized_name = normalize_text(name)
-
-                if domain in public_domains:
-                    # Store for manual assignment
-                    temp_manual_assignments[email] = {
-                        'name': name, 'email': email, 'normalized_name': normalized_name,
-                        'surname': surname, 'given_names': given_names,
-                        'team_id': team_id, 'team_emails': team_emails,
-                        'line': line
-                    }
-                else:
-                    if team_company is None:
-                        team_company = domain
-                        db['companies'].add(domain)
-
-                    new_employees.append({
-                        'name': name, 'email': email, 'normalized_name': normalized_name,
-                        'surname': surname, 'given_names': given_names,
-                        'company': domain, 'source': 'auto',
-                        'team_id': team_id, 'team_emails': team_emails
-                    })
-                    company_person_map[domain].append({
-                        'name': name, 'email': email, 'normalized_name': normalized_name,
-                        'surname': surname, 'given_names': given_names,
-                        'team_id': team_id, 'team_emails': team_emails
-                    })
-                    st.session_state.processed_emails.add(email)
+    # Files are parsed in parallel; public-domain addresses come back separately for manual assignment
+    with stage_timer(stats, 'parse_contacts') as stage:
+        auto_employees, temp_manual_assignments, companies = extract_employees_bulk(
+            [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files],
+            seen_emails, st.session_state.processed_emails, stats, db['teams']
+        )
+        stage['rows_out'] = len(auto_employees) + len(temp_manual_assignments)
+    db['companies'].update(companies)
+    for employee in auto_employees:
+        new_employees.append(employee)
+        company_person_map[employee['company']].append({
+            key: value for key, value in employee.items() if key not in ('company', 'source')
+        })
+        st.session_state.processed_emails.add(employee['email'])
 
     # Update session state with new manual assignments
     for email, data in temp_manual_assignments.items():
@@ -229,7 +335,7 @@ def parse_company_person_data(uploaded_file, db):
                 continue
 
             st.write(f"**Employee:** {data['name']} <{data['email']}>")
-            st.write(f"**From line:** {data['line']}")
+            st.write(f"**From line:** {data['line']} ({data['file']})")
 
             # Use a unique key that persists across reruns
             company_key = f"company_{email}"
@@ -248,18 +354,14 @@ def parse_company_person_data(uploaded_file, db):
                 st.session_state[company_key] = company
 
                 # Add to database
+                name_fields = {key: data[key] for key in ('name', 'normalized_name', 'surname', 'given_names',
+                                                          'normalized_surname', 'normalized_given_names')}
                 new_employees.append({
-                    'name': data['name'], 'email': data['email'],
-                    'normalized_name': data['normalized_name'],
-                    'surname': data['surname'], 'given_names': data['given_names'],
-                    'company': company, 'source': 'manual',
-                    'team_id': data['team_id'], 'team_emails': data['team_emails']
+                    **name_fields, 'email': data['email'],
+                    'company': company, 'source': 'manual', 'team_id': data['team_id']
                 })
                 company_person_map[company].append({
-                    'name': data['name'], 'email': data['email'],
-                    'normalized_name': data['normalized_name'],
-                    'surname': data['surname'], 'given_names': data['given_names'],
-                    'team_id': data['team_id'], 'team_emails': data['team_emails']
+                    **name_fields, 'email': data['email'], 'team_id': data['team_id']
                 })
 
                 db['companies'].add(company)
@@ -289,7 +391,9 @@ def parse_company_person_data(uploaded_file, db):
     else:
         # Only save to database when all assignments are done
         db['employees'].extend(new_employees)
-        save_employee_db(db)
+        with stage_timer(stats, 'save_database', len(new_employees)) as stage:
+            save_employee_db(db, new_employees)
+            stage['rows_out'] = len(new_employees)
 
         if new_employees:
             st.success(f"✅ Added {len(new_employees)} new employees to database")
@@ -297,231 +401,6 @@ def parse_company_person_data(uploaded_file, db):
     return db, company_person_map
 
 
-def find_best_match(target_name, candidates, debug_info=None):
-    """Find the best match using fuzzy matching on full name"""
-    if debug_info is None:
-        debug_info = []
-
-    target_surname, target_given = extract_name_components(target_name)
-    target_possible_givens = [target_given]
-
-    for candidate in candidates:
-        if normalize_text(target_surname) != normalize_text(candidate['surname']):
-            continue
-
-        candidate_given_norm = normalize_text(candidate['given_names'])
-        for possible_given in target_possible_givens:
-            possible_given_norm = normalize_text(possible_given)
-            if (candidate_given_norm.startswith(possible_given_norm) or
-                    possible_given_norm.startswith(candidate_given_norm)):
-                return candidate
-
-    best_score = 0
-    best_match = None
-    for candidate in candidates:
-        score = fuzz.token_set_ratio(normalize_text(target_name), candidate['normalized_name'])
-        if score > 65 and score > best_score:
-            best_score = score
-            best_match = candidate
-
-    return best_match
-
-
-def add_working_days(start_date, working_days):
-    """Add working days excluding weekends"""
-    if working_days <= 0:
-        return start_date
-
-    current_date = start_date
-    days_added = 0
-
-    while days_added < working_days:
-        current_date += timedelta(days=1)
-        monthday = current_date.strftime("%d-%m")
-        if (current_date.weekday() < 5) and (monthday not in holidays):
-            days_added += 1
-        elif monthday in working_holidays:
-            days_added += 1
-
-    return current_date
-
-
-def load_spec_config():
-    """Load specification configuration"""
-    return {
-        "2": {"раздела КР": 2},
-        "3": {},
-        "4": {}
-    }
-
-
-def get_working_days(step_text, workflow_text):
-    """Calculate working days based on stage and specification keywords"""
-    if "Утверждение" in step_text:
-        return (2, 4, "Stage 4")
-
-    stage_match = re.search(r'Шаг (\d+)', step_text)
-    if not stage_match:
-        return (0, 0, "No stage number found")
-
-    step_number = int(stage_match.group(1))
-    stage_number = step_number + 1
-
-    spec_config = load_spec_config()
-    default_days = {2: 3, 3: 5, 4: 2}
-
-    if stage_number not in spec_config:
-        days = default_days.get(stage_number, 0)
-        return (days, stage_number, f"Stage {stage_number}: not configured, using default {days} days")
-
-    stage_keywords = spec_config[stage_number]
-    workflow_lower = workflow_text.lower()
-
-    for keyword, days in stage_keywords.items():
-        if keyword.lower() in workflow_lower:
-            return (days, stage_number, f"Stage {stage_number}: keyword '{keyword}' → {days} days")
-
-    days = default_days.get(stage_number, 0)
-    return (days, stage_number, f"Stage {stage_number}: no keywords found, using default {days} days")
-
-
-def extract_start_date_from_lifecycle(lifecycle_text, current_step_number):
-    """Extract start date from lifecycle text"""
-    if not lifecycle_text or pd.isna(lifecycle_text):
-        return None
-
-    current_stage = current_step_number + 1
-    target_step = current_stage - 2
-
-    if target_step < 0:
-        return None
-
-    step_pattern = rf'Шаг {target_step}.*?(\d{{2}}\.\d{{2}}\.\d{{2}} \d{{2}}:\d{{2}})'
-    matches = re.findall(step_pattern, lifecycle_text, re.IGNORECASE | re.DOTALL)
-
-    if matches:
-        last_date_str = matches[-1]
-        try:
-            return datetime.strptime(last_date_str, '%d.%m.%y %H:%M')
-        except ValueError:
-            return None
-
-    return None
-
-
-def is_team_checked(approver_name, all_people, checked_approvers, matching_log):
-    """Check if any team member is already checked"""
-    best_match = find_best_match(approver_name, all_people, matching_log)
-    if not best_match:
-        return False
-
-    team_id = best_match.get('team_id')
-    team_emails = best_match.get('team_emails', [])
-
-    if not team_id or len(team_emails) <= 1:
-        return False
-
-    team_members = []
-    for person in all_people:
-        if person.get('team_id') == team_id:
-            team_members.append(person)
-
-    for team_member in team_members:
-        for checked_name in checked_approvers:
-            if find_best_match(checked_name, [team_member], matching_log):
-                return True
-
-    return False
-
-
-def process_coordinations(df, company_person_map, selected_date):
-    """Process coordinations with disambiguation"""
-    overdue_counts = defaultdict(int)
-    overdue_emails = []
-    overdue_coordination_ids = []
-    coordination_details = []
-    today = selected_date
-    debug_info = []
-    matching_log = []
-
-    all_people = []
-    for company, persons in company_person_map.items():
-        for person in persons:
-            person['company'] = company
-            all_people.append(person)
-
-    id_column = df.columns[0] if len(df.columns) > 0 else 'id'
-
-    for idx, row in df.iterrows():
-        if not all(col in row for col in ['Не проверили на текущем шаге', 'Шаг', 'Рабочий процесс']):
-            continue
-
-        coord_id = row.get(id_column, 'N/A')
-        step_text = str(row['Шаг'])
-        workflow_text = str(row['Рабочий процесс'])
-
-        working_days, stage_number, days_explanation = get_working_days(step_text, workflow_text)
-
-        try:
-            start_date = None
-            if 'Жизненный цикл' in row and row['Жизненный цикл']:
-                lifecycle_text = str(row['Жизненный цикл'])
-                if "Утверждение" in step_text:
-                    current_step_number = 3
-                    start_date = extract_start_date_from_lifecycle(lifecycle_text, current_step_number)
-                else:
-                    step_match = re.search(r'Шаг (\d+)', step_text)
-                    if step_match:
-                        current_step_number = int(step_match.group(1))
-                        start_date = extract_start_date_from_lifecycle(lifecycle_text, current_step_number)
-
-            if start_date is None:
-                start_date_str = str(row['Дата и время создания согласования'])
-                start_date = datetime.strptime(start_date_str, '%Y-%m-%d %H:%M:%S')
-
-            deadline = add_working_days(start_date, working_days)
-
-            if deadline.date() >= today:
-                continue
-
-        except Exception as e:
-            continue
-
-        not_checked_text = str(row['Не проверили на текущем шаге'])
-        not_checked_approvers = [name.strip() for name in not_checked_text.split(',') if name.strip()]
-
-        checked_text = str(row['Проверили на текущем шаге'])
-        checked_approvers = [name.strip() for name in checked_text.split(',') if name.strip()]
-
-        coord_emails = []
-        coord_companies = set()
-
-        for approver_name in not_checked_approvers:
-            if is_team_checked(approver_name, all_people, checked_approvers, matching_log):
-                continue
-
-            best_match = find_best_match(approver_name, all_people, matching_log)
-            if best_match:
-                coord_emails.append(best_match['email'])
-                coord_companies.add(best_match['company'])
-            else:
-                no_match_array.append(approver_name)
-
-        for company in coord_companies:
-            overdue_counts[company] += 1
-        overdue_emails.extend(coord_emails)
-        overdue_coordination_ids.append(coord_id)
-
-        coordination_details.append({
-            'id': coord_id, 'company': ', '.join(coord_companies),
-            'start_date': start_date.date(), 'deadline': deadline.date(),
-            'working_days': working_days, 'not_checked_count': len(not_checked_approvers),
-            'explanation': days_explanation, 'emails': coord_emails
-        })
-
-    return overdue_counts, overdue_emails, overdue_coordination_ids, coordination_details
-
-
 def main():
     st.set_page_config(page_title="Coordination Processing System", layout="wide")
     st.title("🎯 Coordination Processing System")
@@ -542,18 +421,20 @@ def main():
     # Sidebar for navigation
     st.sidebar.title("Navigation")
     mode = st.sidebar.radio("Select Mode:",
-                            ["Data Loading", "Data Matching", "View Database"])
+                            ["Data Loading", "Data Matching", "History", "View Database"])
+    collect_stats = st.sidebar.checkbox("Collect run statistics", value=False)
 
     if mode == "Data Loading":
         st.header("📥 Data Loading Mode")
         st.write("Process employee data and update database")
 
-        uploaded_file = st.file_uploader("Upload company and employee data file (CSV or Excel)",
-                                         type=['csv', 'xlsx'])
+        uploaded_files = st.file_uploader("Upload company and employee data files (CSV or Excel)",
+                                          type=['csv', 'xlsx'], accept_multiple_files=True)
 
-        if uploaded_file and st.button("Process Employee Data"):
-            with st.spinner("Processing employee data..."):
-                db, company_person_map = parse_company_person_data(uploaded_file, db)
+        if uploaded_files and st.button("Process Employee Data"):
+            with st.spinner(f"Processing {len(uploaded_files)} employee data file(s)..."):
+                stats = new_run_stats() if collect_stats else None
+                db, company_person_map = parse_company_person_data(uploaded_files, db, stats)
                 st.success(
                     f"✅ Data loading completed! Database now contains {len(db['employees'])} employees and {len(db['companies'])} companies")
 
@@ -568,6 +449,9 @@ def main():
                 st.subheader("Companies in Database:")
                 st.write(list(db['companies']))
 
+                if stats is not None:
+                    show_run_stats(stats, "loading_stats.json")
+
     elif mode == "Data Matching":
         st.header("🔍 Data Matching Mode")
         st.write("Process coordination data using existing database")
@@ -580,90 +464,44 @@ def main():
                                          type=['csv', 'xlsx'])
         selected_date = st.date_input("Select reference date for overdue calculation",
                                       value=datetime.today().date())
-
+        batch_matching = st.checkbox("Batch fuzzy matching (uses all CPU cores)", value=True)
+        persist_match_cache = st.checkbox("Remember resolved names between runs", value=True)
+        incremental = st.checkbox("Reuse results of rows unchanged since the last run", value=True)
+        parallel = st.checkbox("Process rows in parallel on all CPU cores", value=False,
+                               disabled=incremental,
+                               help="Only used when results of unchanged rows are not reused")
+        record_history = st.checkbox("Save results to history", value=True)
+        export_formats = ['xlsx', 'csv'] + (['parquet'] if parquet_available() else [])
+        export_format = st.radio("Coordination details export format", export_formats,
+                                 format_func=str.upper, horizontal=True)
+
+        registry = job_registry()
         if uploaded_file and st.button("Process Coordinations"):
-            with st.spinner("Processing coordinations..."):
-                # Read coordination file
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file, sep=';', encoding='utf-8')
-                else:
-                    df = pd.read_excel(uploaded_file, engine='openpyxl')
-
-                # Convert database to company_person_map
-                company_person_map = defaultdict(list)
-                for employee in db['employees']:
-                    company = employee['company']
-                    company_person_map[company].append({
-                        'name': employee['name'], 'email': employee['email'],
-                        'normalized_name': employee['normalized_name'],
-                        'surname': employee['surname'], 'given_names': employee['given_names'],
-                        'team_id': employee.get('team_id', ''),
-                        'team_emails': employee.get('team_emails', [])
-                    })
-
-                # Process coordinations
-                overdue_counts, overdue_emails, overdue_coordination_ids, coordination_details = process_coordinations(
-                    df, company_person_map, selected_date
-                )
-
-                # Store results in session state
-                st.session_state.processing_results = {
-                    'overdue_counts': overdue_counts,
-                    'overdue_emails': overdue_emails,
-                    'overdue_coordination_ids': overdue_coordination_ids,
-                    'coordination_details': coordination_details
-                }
-
-                # Display results
-                st.success("✅ Data matching completed!")
-
-                # Summary statistics
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Total Overdue", len(overdue_coordination_ids))
-                with col2:
-                    st.metric("Unique Emails", len(set(overdue_emails)))
-                with col3:
-                    st.metric("Companies Involved", len(overdue_counts))
-
-                # Overdue counts by company
-                st.subheader("Overdue Coordination Count by Company:")
-                for company, count in sorted(overdue_counts.items(), key=lambda x: x[1], reverse=True):
-                    st.write(f"- **{company}**: {count}")
-
-                # Coordination details
-                st.subheader("Coordination Details:")
-                if coordination_details:
-                    details_df = pd.DataFrame(coordination_details)
-                    st.dataframe(details_df)
-
-                    # Download buttons
-                    col1, col2 = st.columns(2)
-
-                    with col1:
-                        # Download coordination details as Excel
-                        output = io.BytesIO()
-                        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                            details_df.to_excel(writer, index=False, sheet_name='Coordination Details')
-                        st.download_button(
-                            label="📥 Download Coordination Details (Excel)",
-                            data=output.getvalue(),
-                            file_name="coordination_details.xlsx",
-                            mime="application/vnd.ms-excel"
-                        )
-
-                    with col2:
-                        # Download overdue emails
-                        emails_text = "\n".join(sorted(set(overdue_emails)))
-                        st.download_button(
-                            label="📧 Download Overdue Emails",
-                            data=emails_text,
-                            file_name="overdue_emails.txt",
-                            mime="text/plain"
-                        )
-
-                if no_match_array:
-                    st.warning(f"⚠️ Some people were not found in data: {set(no_match_array)}")
+            # company_person_map and match index are cached until the database changes
+            company_person_map, match_index = cached_match_structures(employee_db_signature())
+            # The job outlives this script run, so it gets its own copy of the upload
+            coordination_file = io.BytesIO(uploaded_file.getvalue())
+            coordination_file.name = uploaded_file.name
+            attach_matching_job(submit_job(registry, partial(
+                run_coordination_matching, coordination_file=coordination_file,
+                company_person_map=company_person_map, match_index=match_index, selected_date=selected_date,
+                batch_matching=batch_matching, persist_match_cache=persist_match_cache, incremental=incremental,
+                parallel=parallel, collect_stats=collect_stats, record_history=record_history
+            ), description=uploaded_file.name))
+
+        job_id = attached_matching_job_id()
+        if job_id:
+            job = get_job(registry, job_id)
+            if job is None:
+                st.info("The last matching job is no longer available, please process the file again.")
+                attach_matching_job(None)
+            else:
+                show_matching_job(job, registry, export_format)
+
+    elif mode == "History":
+        st.header("📈 History")
+        st.write("Overdue trends and coordination aging from earlier runs, without reprocessing exports")
+        show_history()
 
     elif mode == "View Database":
         st.header("📊 Employee Database")
@@ -685,3 +523,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+
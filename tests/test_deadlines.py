@@ -0,0 +1,22 @@
+"""compute_deadlines against the add_working_days loop it replaces"""
+from datetime import date, timedelta
+
+import numpy as np
+
+from coordinations_core import add_working_days, compute_deadlines
+
+
+def test_compute_deadlines_matches_add_working_days():
+    # Every start day of three years, weekends, holidays and the 01-11 working holiday included
+    start_dates = [date(2023, 12, 1) + timedelta(days=offset) for offset in range(3 * 365)]
+    for working_days in [0, 1, 2, 5, 10, 30, 250]:
+        expected = [add_working_days(start_date, working_days) for start_date in start_dates]
+        deadlines = compute_deadlines(start_dates, np.full(len(start_dates), working_days))
+        assert deadlines.astype(object).tolist() == expected, working_days
+
+
+def test_compute_deadlines_mixed_working_days():
+    start_dates = [date(2024, 12, 28), date(2025, 1, 1), date(2025, 10, 31), date(2025, 11, 1), date(2025, 3, 7)]
+    working_days = [3, 1, 1, 2, -1]
+    expected = [add_working_days(start_date, days) for start_date, days in zip(start_dates, working_days)]
+    assert compute_deadlines(start_dates, working_days).astype(object).tolist() == expected
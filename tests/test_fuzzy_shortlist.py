@@ -0,0 +1,89 @@
+"""fuzzy_shortlist and the incremental fuzzy index against a full scan of every employee"""
+import random
+
+import numpy as np
+import pytest
+from rapidfuzz import fuzz, process
+
+from benchmarks.generators import generate_employees, approver_spelling
+from coordinations_core import (
+    employee_name_fields, build_company_person_map, index_company_people, normalize_text, shortlist_positions,
+    find_surname_match, find_fuzzy_match, find_best_match, find_best_matches_batch, MATCH_SCORE_THRESHOLD
+)
+
+
+def employee_records(employees):
+    """Employee database records for generated employees, with a company per email domain"""
+    return [dict(employee_name_fields(f"{e['surname']} {e['given']} {e['patronymic']}".strip()),
+                 email=e['email'], company=e['email'].split('@')[1]) for e in employees]
+
+
+def misspell(name, rng):
+    """name with one character dropped, doubled or replaced"""
+    position = rng.randrange(len(name))
+    edit = rng.randrange(3)
+    if edit == 0:
+        return name[:position] + name[position + 1:]
+    if edit == 1:
+        return name[:position] + name[position] + name[position:]
+    return name[:position] + rng.choice('аеиоуыя') + name[position + 1:]
+
+
+@pytest.fixture(scope='module')
+def employees():
+    return generate_employees(3000, seed=11)
+
+
+@pytest.fixture(scope='module')
+def target_names(employees):
+    rng = random.Random(11)
+    names = []
+    for employee in rng.sample(employees, 300):
+        spelling = approver_spelling(employee, rng)
+        names.append(spelling)
+        names.append(misspell(spelling, rng))
+        names.append(f"{employee['given']} {misspell(employee['surname'], rng)}")
+    names += ['Совсем Другое Имя', 'Smith J.', 'А.', '']
+    return names
+
+
+def test_shortlist_keeps_every_candidate_above_threshold(employees, target_names):
+    match_index = index_company_people(build_company_person_map(employee_records(employees)))
+    normalized_names = match_index['normalized_names']
+    for target_name in target_names:
+        target_name_norm = normalize_text(target_name)
+        scores = process.cdist([target_name_norm], normalized_names, scorer=fuzz.token_set_ratio)[0]
+        above = np.flatnonzero(scores > MATCH_SCORE_THRESHOLD)
+        assert np.isin(above, shortlist_positions(match_index, target_name_norm)).all(), target_name
+
+
+def test_shortlisted_matches_equal_full_scan(employees, target_names):
+    match_index = index_company_people(build_company_person_map(employee_records(employees)))
+    people = match_index['people']
+    batch_matches = find_best_matches_batch(target_names, match_index)
+    for target_name in target_names:
+        full_scan = find_fuzzy_match(target_name, people)
+        assert find_fuzzy_match(target_name, people, match_index) is full_scan, target_name
+        assert find_best_match(target_name, people, match_index=match_index) is find_best_match(target_name, people)
+        # The batch tries a surname match before falling back to fuzzy scoring
+        expected = find_surname_match(target_name, people, match_index) or full_scan
+        assert batch_matches[target_name] is expected, target_name
+
+
+def test_extended_index_equals_rebuilt_index(employees, target_names):
+    records = employee_records(employees)
+    previous_index = index_company_people(build_company_person_map([dict(r) for r in records[:2500]]))
+    # Later employees added, one renamed and one removed
+    updated = [dict(r) for r in records]
+    updated[10].update(employee_name_fields('Совсем Другое Имя'))
+    del updated[20]
+
+    extended = index_company_people(build_company_person_map([dict(r) for r in updated]), previous_index=previous_index)
+    rebuilt = index_company_people(build_company_person_map([dict(r) for r in updated]))
+    for target_name in target_names:
+        target_name_norm = normalize_text(target_name)
+        assert np.array_equal(shortlist_positions(extended, target_name_norm),
+                              shortlist_positions(rebuilt, target_name_norm)), target_name
+        extended_match = find_fuzzy_match(target_name, extended['people'], extended)
+        rebuilt_match = find_fuzzy_match(target_name, rebuilt['people'], rebuilt)
+        assert (extended_match and extended_match['email']) == (rebuilt_match and rebuilt_match['email'])
@@ -0,0 +1,61 @@
+"""parse_lifecycle against the per-step regex it replaces"""
+import random
+import re
+from datetime import datetime
+
+from coordinations_core import extract_start_date_from_lifecycle
+
+
+def regex_start_date(lifecycle_text, current_step_number):
+    """The per-step regex extract_start_date_from_lifecycle used before parse_lifecycle"""
+    target_step = current_step_number - 1
+    if target_step < 0:
+        return None
+    step_pattern = rf'Шаг {target_step}.*?(\d{{2}}\.\d{{2}}\.\d{{2}} \d{{2}}:\d{{2}})'
+    matches = re.findall(step_pattern, lifecycle_text, re.IGNORECASE | re.DOTALL)
+    if matches:
+        try:
+            return datetime.strptime(matches[-1], '%d.%m.%y %H:%M')
+        except ValueError:
+            return None
+    return None
+
+
+def random_lifecycle(rng):
+    """Lifecycle text of steps, timestamps (some invalid) and other words, some run together"""
+    parts = []
+    for _ in range(rng.randint(1, 10)):
+        kind = rng.random()
+        if kind < 0.4:
+            parts.append(f"{rng.choice(['Шаг', 'шаг'])} {rng.randint(0, 15)}")
+        elif kind < 0.8:
+            parts.append(f"{rng.randint(1, 31):02d}.{rng.randint(1, 13):02d}.{rng.randint(20, 25):02d} "
+                         f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}")
+        else:
+            parts.append(rng.choice(['Согласование', 'Иванов И.И.', 'подписано', 'Шаг', '1', ',']))
+        parts.append(rng.choice([' ', '\n', ' - ', ', ', '']))
+    return ''.join(parts)
+
+
+def test_parse_lifecycle_matches_regex():
+    rng = random.Random(7)
+    for _ in range(20000):
+        lifecycle_text = random_lifecycle(rng)
+        step = rng.randint(0, 16)
+        assert extract_start_date_from_lifecycle(lifecycle_text, step) == regex_start_date(lifecycle_text, step), \
+            (lifecycle_text, step)
+
+
+def test_step_directly_followed_by_date():
+    # 'Шаг ' running straight into a timestamp: its digits read as step 21 do not hide the timestamp
+    lifecycle_text = 'Шаг 9 Шаг 21.01.25 12:48\nШаг 10 25.12.23 00:11'
+    assert extract_start_date_from_lifecycle(lifecycle_text, 10) == datetime(2025, 1, 21, 12, 48)
+
+    # A step number glued to a timestamp is split into step 4 and the timestamp
+    lifecycle_text = 'Шаг 412.01.25 10:00'
+    assert extract_start_date_from_lifecycle(lifecycle_text, 5) == datetime(2025, 1, 12, 10, 0)
+    assert extract_start_date_from_lifecycle(lifecycle_text, 413) is None
+
+    for lifecycle_text, step in [('Шаг 9 Шаг 21.01.25 12:48\nШаг 10 25.12.23 00:11', 10),
+                                 ('Шаг 412.01.25 10:00', 5), ('Шаг 412.01.25 10:00', 413)]:
+        assert extract_start_date_from_lifecycle(lifecycle_text, step) == regex_start_date(lifecycle_text, step)
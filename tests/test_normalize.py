@@ -0,0 +1,37 @@
+"""_normalize_str against the NFKD and regex normalize_text it replaces"""
+import random
+import re
+import unicodedata
+
+from coordinations_core import normalize_text
+
+
+def regex_normalize_text(text):
+    """normalize_text before the translate table and cache"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join([c for c in text if not unicodedata.combining(c)])
+    text = re.sub(r'[^\w\s.]', '', text)
+    return text.lower().strip()
+
+
+NAME_CHARACTERS = ('абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
+                   'abcxyzABCXYZéÉèñÑüÜçøØßĳﬁ０１ＡＢ²½ℕ' '0123456789' ' \t\n  ' '.,-_\'"()@!?/«»—')
+
+
+def test_normalize_text_matches_regex_on_names():
+    rng = random.Random(3)
+    for _ in range(20000):
+        text = ''.join(rng.choice(NAME_CHARACTERS) for _ in range(rng.randint(0, 30)))
+        assert normalize_text(text) == regex_normalize_text(text), text
+
+
+def test_normalize_text_matches_regex_on_all_code_points():
+    characters = [chr(code_point) for code_point in range(0x30000) if not 0xd800 <= code_point < 0xe000]
+    for start in range(0, len(characters), 64):
+        text = 'a' + ''.join(characters[start:start + 64]) + ' Б.'
+        assert normalize_text(text) == regex_normalize_text(text), hex(ord(characters[start]))
+
+
+def test_normalize_text_non_strings():
+    assert normalize_text(None) == ''
+    assert normalize_text(float('nan')) == ''